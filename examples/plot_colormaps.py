@@ -11,6 +11,9 @@ Currently, I made 6 categorical colormap
 - river_nights (9)
 - spring_pastels (9)
 
+For more types, :func:`milkviz.distinct_colors` generates any number
+of distinct colors, use "distinct<n>" like "distinct100" as a colormap.
+
 """
 import numpy as np
 import matplotlib.pyplot as plt
@@ -46,3 +49,12 @@ def plot_cmap(cmap_list):
 #
 plot_cmap(["echarts", "tailwind", "retro_metro",
            "dutch_field", "river_nights", "spring_pastels"])
+
+
+# %%
+# Distinct colors for many types
+# -------------------------------------
+#
+mv.register_colormap("distinct50", mv.distinct_cmap(50))
+mv.register_colormap("distinct200", mv.distinct_cmap(200))
+plot_cmap(["distinct50", "distinct200"])
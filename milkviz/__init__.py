@@ -2,11 +2,16 @@ from ._bubble import bubble
 from ._cell_map import point_map, polygon_map
 from ._clustermap import anno_clustermap
 from ._dot_matrix import dot_heatmap
+from ._dynamic_graph import dynamic_graph
 from ._graph import graph
+from ._render import render_rgba
+from ._scale import StreamingStats
+from ._sketch import SetSketch
 from ._stacked_bar import stacked_bar
-# from ._upset import upset
+from ._upset import upset
 from ._venn import venn
 from .colormap import echarts, tailwind, retro_metro, river_nights, dutch_field, spring_pastels
+from .colormap import distinct_colors, distinct_cmap
 
 from .utils import register_colormap
 
@@ -1,9 +1,53 @@
 import matplotlib as mpl
 import matplotlib.pyplot as plt
+import numpy as np
 from matplotlib.colors import Normalize
 
 from legendkit import SizeLegend, Colorbar
 from milkviz.utils import set_default
+from ._scale import StreamingStats, get_stats
+
+
+def _grid_bins(x, y, gridsize, grid="hex"):
+    """Assign points to hexagon or square bins
+
+    The hexagon lattice is the same as :meth:`matplotlib.axes.Axes.hexbin`.
+    Returns the center of each occupied bin and the bin of each point.
+    """
+    if np.ndim(gridsize) == 0:
+        nx = int(gridsize)
+        ny = int(nx / np.sqrt(3)) if grid == "hex" else nx
+    else:
+        nx, ny = gridsize
+    xmin, xmax = np.min(x), np.max(x)
+    ymin, ymax = np.min(y), np.max(y)
+    sx = (xmax - xmin) / nx if xmax > xmin else 1.
+    sy = (ymax - ymin) / ny if ymax > ymin else 1.
+    ix = (x - xmin) / sx
+    iy = (y - ymin) / sy
+    if grid == "hex":
+        i1, j1 = np.round(ix).astype(np.int64), np.round(iy).astype(np.int64)
+        i2, j2 = np.floor(ix).astype(np.int64), np.floor(iy).astype(np.int64)
+        d1 = (ix - i1) ** 2 + 3 * (iy - j1) ** 2
+        d2 = (ix - i2 - .5) ** 2 + 3 * (iy - j2 - .5) ** 2
+        first = d1 < d2
+        # the two lattices are numbered one after another
+        bin_id = np.where(first, i1 * (ny + 1) + j1,
+                          (nx + 1) * (ny + 1) + i2 * ny + j2)
+        cx = np.where(first, i1, i2 + .5)
+        cy = np.where(first, j1, j2 + .5)
+    elif grid == "square":
+        i = np.minimum(np.floor(ix).astype(np.int64), nx - 1)
+        j = np.minimum(np.floor(iy).astype(np.int64), ny - 1)
+        bin_id = i * ny + j
+        cx, cy = i + .5, j + .5
+    else:
+        raise ValueError(f"grid must be 'hex' or 'square', got '{grid}'")
+    uni, first_ix, inverse = np.unique(bin_id, return_index=True,
+                                       return_inverse=True)
+    centers = np.column_stack([xmin + cx[first_ix] * sx,
+                               ymin + cy[first_ix] * sy])
+    return centers, inverse
 
 
 def bubble(data=None,
@@ -18,6 +62,9 @@ def bubble(data=None,
            sizes=(10, 250),
            size_norm=None,
            dtype=None,
+           gridsize=None,
+           grid="hex",
+           reduce="count",
            legend_kw=None,
            cbar_kw=None,
            ax=None,
@@ -33,12 +80,26 @@ def bubble(data=None,
     hue :
     size :
     cmap : default to "RdBu"
-    norm :
+    norm : Normalize or StreamingStats
+        The norm of hue, a :class:`StreamingStats` built over the
+        full data is turned into a norm
     vmin :
     vmax :
     sizes :
-    size_norm :
+    size_norm : Normalize or StreamingStats
+        The norm of size, a :class:`StreamingStats` also supplies
+        the values shown in the size legend
     dtype:
+    gridsize : int or (int, int)
+        Aggregate the points into a grid with this number of bins in
+        x direction, or in (x, y) direction, one bubble is drawn per
+        occupied bin. Use for large data where markers overlap
+    grid : {"hex", "square"}
+        The shape of bins
+    reduce : {"count", "sum", "mean"}
+        How the bubble size is derived from the points in a bin,
+        "sum" and "mean" are computed on `size`.
+        The hue of a bin is always the mean
     legend_kw : dict
         The options to configure legend
     cbar_kw : dict
@@ -46,7 +107,8 @@ def bubble(data=None,
     ax :
 
     """
-    ax = set_default(ax, plt.gca())
+    if ax is None:
+        ax = plt.gca()
     legend_kw = set_default(legend_kw, {})
     cbar_kw = set_default(cbar_kw, {})
 
@@ -56,13 +118,42 @@ def bubble(data=None,
         hue = data[hue].to_numpy() if hue is not None else None
         size = data[size].to_numpy() if size is not None else None
 
+    if gridsize is not None:
+        centers, inverse = _grid_bins(np.asarray(x, dtype=float),
+                                      np.asarray(y, dtype=float),
+                                      gridsize, grid)
+        x, y = centers[:, 0], centers[:, 1]
+        counts = np.bincount(inverse)
+        if hue is not None:
+            hue = np.bincount(inverse, np.asarray(hue, dtype=float)) / counts
+        if reduce == "count":
+            size = counts
+            dtype = set_default(dtype, int)
+        elif reduce in ("sum", "mean"):
+            if size is None:
+                raise ValueError(f"`size` must be provided to reduce "
+                                 f"by '{reduce}'")
+            size = np.bincount(inverse, np.asarray(size, dtype=float))
+            if reduce == "mean":
+                size = size / counts
+        else:
+            raise ValueError(f"reduce must be 'count', 'sum' or 'mean', "
+                             f"got '{reduce}'")
+
     if size is None:
         raise ValueError("At least `size` must be provided")
 
-    if size_norm is None:
-        size_norm = Normalize()
-        size_norm.autoscale(size)
-    circ_size = size_norm(size) * (sizes[1] - sizes[0]) + sizes[0]
+    if isinstance(norm, StreamingStats):
+        norm = norm.norm()
+    size_stats = get_stats(size_norm if isinstance(size_norm, StreamingStats)
+                           else size)
+    if not isinstance(size_norm, Normalize):
+        size_norm = size_stats.norm()
+
+    def scale(v):
+        return size_norm(v) * (sizes[1] - sizes[0]) + sizes[0]
+
+    circ_size = scale(size)
     bubbles = ax.scatter(x, y,
                          s=circ_size,
                          c=hue,
@@ -78,7 +169,9 @@ def bubble(data=None,
         dtype=dtype
     )
     legend_options = {**legend_options, **legend_kw}
-    SizeLegend(sizes=circ_size, array=size, ax=ax, **legend_options)
+    legend_values = size_stats.legend_values()
+    SizeLegend(sizes=scale(legend_values), array=legend_values, ax=ax,
+               **legend_options)
     if hue is not None:
         cbar_options = dict(
             loc="out right lower",
@@ -8,7 +8,9 @@ from matplotlib.colors import is_color_like, Normalize, TwoSlopeNorm
 from mpl_toolkits.mplot3d import Axes3D
 
 from legendkit import Colorbar
-from .utils import rotate_points, set_default, cat_colors, set_cat_legend
+from .utils import rotate_points, set_default, cat_colors, set_cat_legend, \
+    get_affine, type_counts
+from ._scale import StreamingStats
 
 
 def _set_cbar(mappable, ax, cbar_kw):
@@ -22,13 +24,16 @@ def _set_cbar(mappable, ax, cbar_kw):
 
 def handle_cmap_norm(cmap, norm, values, vmin, vmax, center):
     cmap = set_default(cmap, "OrRd")
+    if isinstance(norm, StreamingStats):
+        norm = norm.norm()
+    if norm is not None and center is None:
+        return cmap, norm
     vmin = np.nanmin(values) if vmin is None else vmin
     vmax = np.nanmax(values) if vmax is None else vmax
     if center is not None:
         norm = TwoSlopeNorm(center, vmin=vmin, vmax=vmax)
     else:
-        if norm is None:
-            norm = Normalize(vmin=vmin, vmax=vmax)
+        norm = Normalize(vmin=vmin, vmax=vmax)
     return cmap, norm
 
 
@@ -46,6 +51,7 @@ def point_map(
         vmax=None,
         center=None,
         rotate=None,
+        transform=None,
         markersize=5,
         edgecolor=None,
         edgewidth=None,
@@ -75,13 +81,19 @@ def point_map(
     colors : array, mapping
         Either array that represents colors or a dict that map types to colors
     cmap :
-    norm :
+    norm : Normalize or StreamingStats
     vmin :
     vmax :
     center :
     rotate : float
         The degree to rotate the whole plot according to origin,
         only rotate x and y
+    transform : Affine2D or array of shape (3, 3)
+        An affine transform of x and y applied after the rotation,
+        like a flip, scale or offset. The points are not copied,
+        an Affine2D modified later moves the drawn points, but the
+        limits of the axes are not updated, reset them with
+        ``ax.set_xlim`` and ``ax.set_ylim``
     markersize : float
         The size of marker
     edgecolor : color
@@ -95,7 +107,9 @@ def point_map(
     legend : bool
         Whether to show the legend
     legend_kw : dict
-        Pass to :func:`legendkit.legend`
+        Pass to :func:`legendkit.legend`, `max_items` limits the
+        number of types in the legend to the most frequent ones,
+        the others are grouped and colored as one
     cbar_kw : dict
         Pass to :func:`legend.colorbar`
     ax : Axes
@@ -127,7 +141,8 @@ def point_map(
         ax.set_ylabel("Y", labelpad=-14)
         ax.set_zlabel("Z", labelpad=-14)
     else:
-        ax = plt.gca()
+        if ax is None:
+            ax = plt.gca()
         ax.set_aspect("equal")
         if frameon:
             ax.tick_params(top=False, bottom=False, left=False, right=False,
@@ -139,8 +154,17 @@ def point_map(
     legend_kw = set_default(legend_kw, {})
     cbar_kw = set_default(cbar_kw, {})
 
-    if rotate is not None:
-        x, y = rotate_points(x, y, (0, 0), rotate)
+    affine = get_affine(rotate, transform)
+    if dim == 3:
+        # 3D axes don't support the transform of artists
+        if rotate is not None:
+            x, y = rotate_points(x, y, (0, 0), rotate)
+        if transform is not None:
+            x, y = get_affine(transform=transform).transform(
+                np.column_stack([x, y])).T
+        kwargs_trans = {}
+    else:
+        kwargs_trans = dict(transform=affine + ax.transData)
 
     points = (x, y) if dim == 2 else (x, y, z)
 
@@ -151,21 +175,27 @@ def point_map(
         lines = np.array([[[x[i1], y[i1]],
                            [x[i2], y[i2]]] for i1, i2 in links])
         line_collections = LineCollection(lines, linewidths=linkwidth,
-                                          edgecolors=linkcolor, zorder=-100)
+                                          edgecolors=linkcolor, zorder=-100,
+                                          **kwargs_trans)
         ax.add_collection(line_collections)
 
     if types is not None:
+        # the types grouped as other in the legend are colored the same
+        max_items = set_default(legend_kw, {}).get("max_items") \
+            if legend else None
         color_array, legend_labels, legend_colors = \
-            cat_colors(types, order, cmap, colors)
+            cat_colors(types, order, cmap, colors, max_items=max_items)
         ax.scatter(*points, s=markersize, c=color_array,
                    linewidths=edgewidth,
                    edgecolors=edgecolor,
+                   **kwargs_trans,
                    **kwargs)
         if legend:
             set_cat_legend(legend_labels, legend_colors, ax,
                            edgecolor=edgecolor,
                            edgewidth=edgewidth,
-                           legend_kw=legend_kw)
+                           legend_kw=legend_kw,
+                           counts=type_counts(types, legend_labels))
     else:
         if values is not None:
             cmap, norm = handle_cmap_norm(cmap, norm, values,
@@ -174,11 +204,12 @@ def point_map(
                                   norm=norm, cmap=cmap,
                                   linewidths=edgewidth,
                                   edgecolors=edgecolor,
+                                  **kwargs_trans,
                                   **kwargs)
             if legend:
                 _set_cbar(mappable, ax, cbar_kw)
         else:
-            ax.scatter(*points, s=markersize, **kwargs)
+            ax.scatter(*points, s=markersize, **kwargs_trans, **kwargs)
     return ax
 
 
@@ -195,6 +226,7 @@ def polygon_map(
         vmax=None,
         center=None,
         rotate=None,
+        transform=None,
         edgecolor=None,
         edgewidth=None,
         frameon=False,
@@ -219,12 +251,18 @@ def polygon_map(
     colors : array, mapping
         Either array that represents colors or a dict that map types to colors
     cmap :
-    norm :
+    norm : Normalize or StreamingStats
     vmin :
     vmax :
     center :
     rotate : float
         The degree to rotate the whole plot according to origin
+    transform : Affine2D or array of shape (3, 3)
+        An affine transform applied after the rotation,
+        like a flip, scale or offset. The polygons are not copied,
+        an Affine2D modified later moves the drawn polygons, but the
+        limits of the axes are not updated, reset them with
+        ``ax.set_xlim`` and ``ax.set_ylim``
     edgecolor : color
     edgewidth : float
     frameon : bool
@@ -232,7 +270,9 @@ def polygon_map(
     legend : bool
         Whether to show the legend
     legend_kw : dict
-        Pass to :func:`legendkit.legend`
+        Pass to :func:`legendkit.legend`, `max_items` limits the
+        number of types in the legend to the most frequent ones,
+        the others are grouped and colored as one
     cbar_kw : dict
         Pass to :func:`legend.colorbar`
     ax : Axes
@@ -244,20 +284,10 @@ def polygon_map(
     Axes
 
     """
-    polygons = [np.array(polygon) for polygon in polygons]
-    vstack_poly = np.vstack(polygons)
-    xmin, ymin = np.min(vstack_poly, axis=0)
-    xmax, ymax = np.max(vstack_poly, axis=0)
+    polygons = [np.asarray(polygon) for polygon in polygons]
     legend_kw = set_default(legend_kw, {})
     cbar_kw = set_default(cbar_kw, {})
 
-    if rotate is not None:
-        rotated_polygons = []
-        for polygon in polygons:
-            x, y = rotate_points(polygon[:, 0], polygon[:, 1], (0, 0), rotate)
-            rotated_polygons.append([(i, j) for i, j in zip(x, y)])
-        polygons = rotated_polygons
-
     if ax is None:
         ax = plt.gca()
         ax.set_aspect('equal')
@@ -268,21 +298,23 @@ def polygon_map(
     else:
         ax.set_axis_off()
 
-    ax.set_xlim(xmin, xmax)
-    ax.set_ylim(ymin, ymax)
-
     patches = [mpatches.Polygon(polygon) for polygon in polygons]
+    # the geometry stays as is, rotated at draw time
+    trans = get_affine(rotate, transform) + ax.transData
 
     if types is not None:
+        max_items = set_default(legend_kw, {}).get("max_items") \
+            if legend else None
         cmap = set_default(cmap, "echarts")
         color_array, legend_labels, legend_colors = \
-            cat_colors(types, order, cmap, colors)
+            cat_colors(types, order, cmap, colors, max_items=max_items)
 
         patches_collections = PatchCollection(
             patches,
             facecolors=color_array,
             linewidths=edgewidth,
             edgecolors=edgecolor,
+            transform=trans,
             **kwargs,
         )
         if legend:
@@ -290,19 +322,24 @@ def polygon_map(
                            shape="square",
                            edgecolor=edgecolor,
                            edgewidth=edgewidth,
-                           legend_kw=legend_kw)
+                           legend_kw=legend_kw,
+                           counts=type_counts(types, legend_labels))
     else:
         if values is not None:
             cmap, norm = handle_cmap_norm(cmap, norm, values,
                                           vmin, vmax, center)
             patches_collections = PatchCollection(
                 patches, cmap=cmap, norm=norm, linewidths=edgewidth,
-                edgecolors=edgecolor, **kwargs)
+                edgecolors=edgecolor, transform=trans, **kwargs)
             patches_collections.set_array(values)
             if legend:
                 _set_cbar(patches_collections, ax, cbar_kw)
         else:
-            patches_collections = PatchCollection(patches)
+            patches_collections = PatchCollection(patches, transform=trans)
     ax.add_collection(patches_collections)
+    (xmin, ymin), (xmax, ymax) = \
+        patches_collections.get_datalim(ax.transData).get_points()
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
 
     return ax
@@ -0,0 +1,239 @@
+"""Scalable hierarchical clustering used by anno_clustermap"""
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.cluster import hierarchy
+from scipy.spatial.distance import cdist
+
+# The number of distance entries computed in one block,
+# bound the temporary memory to ~32MB per thread
+BLOCK_ENTRIES = 2 ** 22
+# Up to this size, the condensed distance matrix takes ~100MB,
+# k-means aggregation is not worth it
+EXACT_SIZE = 5000
+
+
+def chunked_pdist(X, metric="euclidean", n_jobs=None):
+    """Condensed pairwise distances computed block by block
+
+    Equivalent to :func:`scipy.spatial.distance.pdist`, but the rows
+    are processed in blocks across a thread pool, only the condensed
+    result is ever held in full.
+
+    Parameters
+    ----------
+    X : array-like
+        The (n, d) observations
+    metric : str
+        The distance metric, "euclidean" and "sqeuclidean" use a
+        matrix product, others are passed to :func:`scipy.spatial.distance.cdist`
+    n_jobs : int
+        The number of threads, default to the number of CPUs
+
+    Returns
+    -------
+    np.ndarray
+        The condensed distance matrix in float64
+
+    """
+    X = np.asarray(X)
+    n = X.shape[0]
+    dist = np.empty(n * (n - 1) // 2, dtype=np.float64)
+    chunk_size = max(1, BLOCK_ENTRIES // max(n, 1))
+    use_dot = metric in ("euclidean", "sqeuclidean")
+    if use_dot:
+        sq = np.einsum("ij,ij->i", X, X, dtype=np.float64)
+
+    def fill(start):
+        stop = min(start + chunk_size, n)
+        block = X[start:stop]
+        if use_dot:
+            d = block @ X[start:].T
+            d = sq[start:stop, np.newaxis] + sq[np.newaxis, start:] - 2 * d
+            np.maximum(d, 0, out=d)
+            if metric == "euclidean":
+                np.sqrt(d, out=d)
+        else:
+            d = cdist(block, X[start:], metric=metric)
+        for i in range(start, stop):
+            offset = n * i - i * (i + 1) // 2
+            dist[offset:offset + n - i - 1] = d[i - start, i - start + 1:]
+
+    n_jobs = os.cpu_count() if n_jobs is None else n_jobs
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        list(pool.map(fill, range(0, n, chunk_size)))
+    return dist
+
+
+def exact_linkage(X, method="average", metric="euclidean", n_jobs=None):
+    """Hierarchical clustering on the chunked distance matrix"""
+    dist = chunked_pdist(X, metric=metric, n_jobs=n_jobs)
+    return hierarchy.linkage(dist, method=method)
+
+
+def _nearest_center(X, centers, chunk_size=None):
+    """The index of the nearest center for each row of X"""
+    n = X.shape[0]
+    chunk_size = max(1, BLOCK_ENTRIES // len(centers)) \
+        if chunk_size is None else chunk_size
+    c_sq = np.einsum("ij,ij->i", centers, centers)
+    labels = np.empty(n, dtype=np.intp)
+    for start in range(0, n, chunk_size):
+        block = X[start:start + chunk_size]
+        d = c_sq[np.newaxis, :] - 2 * (block @ centers.T)
+        labels[start:start + chunk_size] = np.argmin(d, axis=1)
+    return labels
+
+
+def minibatch_kmeans(X, n_clusters, batch_size=1024, max_iter=100,
+                     random_state=0):
+    """Mini-batch k-means (Sculley, 2010)
+
+    Parameters
+    ----------
+    X : array-like
+        The (n, d) observations, a memmap is only read in batches
+    n_clusters : int
+        The number of centroids
+    batch_size : int
+    max_iter : int
+        The number of mini-batches to draw
+    random_state : int
+
+    Returns
+    -------
+    centers : np.ndarray
+        The (n_clusters, d) centroids
+    labels : np.ndarray
+        The centroid index of each observation
+
+    """
+    rng = np.random.default_rng(random_state)
+    n = X.shape[0]
+    init = np.sort(rng.choice(n, n_clusters, replace=False))
+    centers = np.asarray(X[init], dtype=np.float64)
+    counts = np.zeros(n_clusters)
+    batch_size = min(batch_size, n)
+    for _ in range(max_iter):
+        ix = np.sort(rng.choice(n, batch_size, replace=False))
+        batch = np.asarray(X[ix], dtype=np.float64)
+        labels = _nearest_center(batch, centers)
+        order = np.argsort(labels, kind="stable")
+        updated, starts, batch_counts = np.unique(
+            labels[order], return_index=True, return_counts=True)
+        batch_sums = np.add.reduceat(batch[order], starts, axis=0)
+        counts[updated] += batch_counts
+        # per-center learning rate 1 / count, applied to the whole batch
+        centers[updated] += (
+            batch_sums - batch_counts[:, np.newaxis] * centers[updated]
+        ) / counts[updated, np.newaxis]
+    labels = _nearest_center(X, centers.astype(X.dtype, copy=False))
+    return centers, labels
+
+
+def _balanced_merge(Z, row, leaves, sizes, n):
+    """Join nodes pairwise into one subtree at zero height
+
+    The nodes keep their order in the dendrogram leaves,
+    the depth of the subtree is log2 of the number of nodes.
+    """
+    leaves, sizes = list(leaves), list(sizes)
+    while len(leaves) > 1:
+        merged, merged_sizes = [], []
+        for i in range(0, len(leaves) - 1, 2):
+            size = sizes[i] + sizes[i + 1]
+            Z[row] = (leaves[i], leaves[i + 1], 0, size)
+            merged.append(n + row)
+            merged_sizes.append(size)
+            row += 1
+        if len(leaves) % 2:
+            merged.append(leaves[-1])
+            merged_sizes.append(sizes[-1])
+        leaves, sizes = merged, merged_sizes
+    return leaves[0], row
+
+
+def kmeans_linkage(X, n_clusters=1000, method="average", metric="euclidean",
+                   n_jobs=None, random_state=0):
+    """Approximate linkage by clustering the k-means centroids
+
+    The rows are aggregated into centroids with mini-batch k-means,
+    the centroids are clustered hierarchically, every centroid is then
+    expanded to its members, ordered by the distance to the centroid.
+    The result is a valid linkage over all rows, so it can be passed to
+    :func:`seaborn.clustermap` as ``row_linkage`` or ``col_linkage``.
+
+    Parameters
+    ----------
+    X : array-like
+        The (n, d) observations
+    n_clusters : int
+        The number of centroids, if n <= n_clusters or n <= 5000,
+        the exact linkage is computed instead
+    method : str
+        The linkage method for centroids
+    metric : str
+        The distance metric for centroids
+    n_jobs : int
+    random_state : int
+
+    Returns
+    -------
+    np.ndarray
+        The linkage matrix in the form of :func:`scipy.cluster.hierarchy.linkage`
+
+    """
+    n = X.shape[0]
+    if n <= max(n_clusters, EXACT_SIZE):
+        return exact_linkage(X, method=method, metric=metric, n_jobs=n_jobs)
+
+    centers, labels = minibatch_kmeans(X, n_clusters,
+                                       random_state=random_state)
+    # drop the centroids that end up with no member
+    occupied, labels = np.unique(labels, return_inverse=True)
+    centers = centers[occupied]
+    k = len(occupied)
+
+    to_center = np.empty(n)
+    chunk_size = max(1, BLOCK_ENTRIES // X.shape[1])
+    for start in range(0, n, chunk_size):
+        stop = start + chunk_size
+        d = np.asarray(X[start:stop], dtype=np.float64) \
+            - centers[labels[start:stop]]
+        to_center[start:stop] = np.einsum("ij,ij->i", d, d)
+    order = np.lexsort((to_center, labels))
+    bounds = np.searchsorted(labels[order], np.arange(k + 1))
+
+    Z = np.empty((n - 1, 4), dtype=np.float64)
+    row = 0
+    cluster_nodes = np.empty(k, dtype=np.int64)
+    cluster_sizes = np.diff(bounds)
+    for c in range(k):
+        members = order[bounds[c]:bounds[c + 1]]
+        cluster_nodes[c], row = _balanced_merge(
+            Z, row, members, np.ones(len(members), dtype=np.int64), n)
+
+    if k > 1:
+        Zc = exact_linkage(centers, method=method, metric=metric,
+                           n_jobs=n_jobs)
+        # relabel the centroid tree into the ids of the full tree
+        offset = n + row - k
+        nodes = Zc[:, :2].astype(np.int64)
+        Z[row:, :2] = np.where(nodes < k,
+                               cluster_nodes[np.minimum(nodes, k - 1)],
+                               nodes + offset)
+        Z[row:, 2:] = Zc[:, 2:]
+        Z[row:, 3] = _subtree_sizes(Zc, cluster_sizes)
+    return Z
+
+
+def _subtree_sizes(Z, leaf_sizes):
+    """The number of original observations under each merge of Z"""
+    k = len(leaf_sizes)
+    sizes = np.concatenate([leaf_sizes, np.zeros(len(Z))])
+    for i, (a, b) in enumerate(Z[:, :2].astype(np.int64)):
+        sizes[k + i] = sizes[a] + sizes[b]
+    return sizes[k:]
@@ -1,18 +1,365 @@
 from __future__ import annotations
 
+import matplotlib as mpl
 import numpy as np
 import pandas as pd
 import seaborn as sns
 from matplotlib.collections import QuadMesh
-from matplotlib.colors import to_hex
-from typing import List, Optional, Dict, Any
+from matplotlib.colors import to_hex, to_rgba_array, ListedColormap
+from matplotlib.image import AxesImage
+from seaborn.matrix import ClusterGrid, _index_to_label, _index_to_ticklabels
+from natsort import natsorted
+from typing import List, Optional, Dict, Any, Tuple, NamedTuple
 
 from legendkit import CatLegend, Colorbar, vstack, hstack
 from milkviz.utils import set_default, cat_colors, get_colormap
+from ._cell_map import handle_cmap_norm
+
+# The number of matrix entries pooled at once in image rendering
+POOL_ENTRIES = 2 ** 24
+
+
+def _compute_linkage(data, backend,
+                     row_cluster=True,
+                     col_cluster=True,
+                     n_clusters=1000,
+                     n_jobs=None,
+                     random_state=0,
+                     method="average",
+                     metric="euclidean",
+                     z_score=None,
+                     standard_scale=None,
+                     row_linkage=None,
+                     col_linkage=None,
+                     **kwargs):
+    """Compute row_linkage and col_linkage for seaborn.clustermap"""
+    from ._cluster import exact_linkage, kmeans_linkage
+
+    if backend == "chunked":
+        def linkage(arr):
+            return exact_linkage(arr, method=method, metric=metric,
+                                 n_jobs=n_jobs)
+    elif backend == "kmeans":
+        def linkage(arr):
+            return kmeans_linkage(arr, n_clusters=n_clusters,
+                                  method=method, metric=metric,
+                                  n_jobs=n_jobs, random_state=random_state)
+    else:
+        raise ValueError(f"Unknown cluster_backend '{backend}', "
+                         f"options are 'seaborn', 'chunked' and 'kmeans'")
+
+    # cluster on the same data as seaborn does
+    if z_score is not None:
+        data = ClusterGrid.z_score(data, z_score)
+    if standard_scale is not None:
+        data = ClusterGrid.standard_scale(data, standard_scale)
+    arr = data.to_numpy()
+
+    linkages = {}
+    if row_cluster and row_linkage is None:
+        linkages["row_linkage"] = linkage(arr)
+    if col_cluster and col_linkage is None:
+        linkages["col_linkage"] = linkage(arr.T)
+    return linkages
+
+
+def _reorder_info(info, order):
+    """Reorder annotations so that each level follows the given labels
+
+    Items not in the labels are dropped, the same as
+    reindexing a MultiIndex by level.
+
+    Returns
+    -------
+    The reordered annotations and the positional indexer
+
+    """
+    ix = np.arange(len(info))
+    for name, labels in order.items():
+        codes = pd.Categorical(info[name].to_numpy()[ix],
+                               categories=labels).codes
+        ix = ix[codes >= 0][np.argsort(codes[codes >= 0], kind="stable")]
+    return info.iloc[ix].reset_index(drop=True), ix
+
+
+class _ColorMatrix(NamedTuple):
+    """Annotation colors stored as integer codes into an RGBA table"""
+    codes: np.ndarray  # (levels, n), index into lut
+    lut: np.ndarray  # (k, 4), the RGBA colors
+    labels: List[str]  # the name of each level
+
+
+def _annotation_colors(info, cmap):
+    """Map annotation levels to colors through categorical codes
+
+    All levels share the same colors, missing values are white.
+
+    Returns
+    -------
+    The color matrix, and the mapping from label to hex color for legend
+
+    """
+    cats = [pd.Categorical(info[c]) for c in info.columns]
+    uni_types = natsorted(set().union(*[c.categories for c in cats]))
+    _, legend_labels, legend_colors = cat_colors(uni_types, order=uni_types,
+                                                 cmap=cmap)
+    lut = to_rgba_array(legend_colors + ["white"])
+    uni_index = pd.Index(legend_labels)
+    codes = np.empty((len(cats), len(info)), dtype=np.intp)
+    for i, c in enumerate(cats):
+        remap = np.append(uni_index.get_indexer(c.categories), len(lut) - 1)
+        # the code of missing value is -1, maps to white
+        codes[i] = remap[c.codes]
+    # convert to hex to ensure str dtype
+    mapper = dict(zip(legend_labels, [to_hex(c) for c in legend_colors]))
+    return _ColorMatrix(codes, lut, list(info.columns)), mapper
+
+
+def _bin_edges(n, bins):
+    """Split n items into at most `bins` contiguous bins"""
+    return np.unique(np.linspace(0, n, min(bins, n) + 1).astype(int))
+
+
+def _pool_block(block, row_edges, col_edges, pooling):
+    if pooling == "mean":
+        valid = ~np.isnan(block)
+        total = np.where(valid, block, 0)
+        total = np.add.reduceat(np.add.reduceat(total, row_edges, axis=0),
+                                col_edges, axis=1)
+        count = np.add.reduceat(np.add.reduceat(valid, row_edges, axis=0),
+                                col_edges, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return total / count
+    elif pooling == "max":
+        return np.fmax.reduceat(np.fmax.reduceat(block, row_edges, axis=0),
+                                col_edges, axis=1)
+    else:
+        raise ValueError(f"Unknown pooling '{pooling}', "
+                         f"options are 'mean' and 'max'")
+
+
+def pool_matrix(data, yind, xind, shape, pooling="mean"):
+    """Reorder a matrix and downsample it by block pooling
+
+    The matrix is never reordered as a whole, rows are gathered and
+    pooled a few bins at a time.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The 2D matrix, can be a memmap
+    yind, xind : array-like
+        The order of rows and columns
+    shape : (int, int)
+        The maximum number of (rows, columns) in the output
+    pooling : {"mean", "max"}
+        How to reduce the values in each block, NaN is ignored
+
+    Returns
+    -------
+    np.ndarray
+
+    """
+    yind, xind = np.asarray(yind), np.asarray(xind)
+    row_edges = _bin_edges(len(yind), shape[0])
+    col_edges = _bin_edges(len(xind), shape[1])
+    n_bins = len(row_edges) - 1
+    out = np.empty((n_bins, len(col_edges) - 1),
+                   dtype=np.result_type(data.dtype, np.float32))
+    rows_per_bin = max(1, len(yind) // n_bins)
+    step = max(1, POOL_ENTRIES // (len(xind) * rows_per_bin))
+    for i in range(0, n_bins, step):
+        edges = row_edges[i:i + step + 1]
+        block = data[np.ix_(yind[edges[0]:edges[-1]], xind)]
+        out[i:i + step] = _pool_block(block, edges[:-1] - edges[0],
+                                      col_edges[:-1], pooling)
+    return out
+
+
+class _AnnoClusterGrid(ClusterGrid):
+    """ClusterGrid that can draw the heatmap as a single image
+
+    With render="image", the reordered matrix is pooled to the pixel
+    resolution of the heatmap and drawn with :meth:`Axes.imshow`,
+    the color stripes are drawn the same way.
+    """
+
+    def __init__(self, data, render="mesh", image_size=None,
+                 pooling="mean", **kwargs):
+        super().__init__(data, **kwargs)
+        if render not in ("mesh", "image"):
+            raise ValueError(f"Unknown render '{render}', "
+                             f"options are 'mesh' and 'image'")
+        self.render = render
+        self.pooling = pooling
+        if image_size is None:
+            bbox = self.ax_heatmap.get_window_extent()
+            image_size = (int(bbox.height), int(bbox.width))
+        self.image_size = image_size
+
+    def _preprocess_colors(self, data, colors, axis):
+        if isinstance(colors, _ColorMatrix):
+            return colors, colors.labels
+        return super()._preprocess_colors(data, colors, axis)
+
+    def dim_ratios(self, colors, dendrogram_ratio, colors_ratio):
+        if isinstance(colors, _ColorMatrix):
+            # one stripe per level, the same shape as a list of rgb colors
+            colors = colors.codes[..., np.newaxis]
+        return super().dim_ratios(colors, dendrogram_ratio, colors_ratio)
+
+    def plot_colors(self, xind, yind, **kws):
+        kws = {k: v for k, v in kws.items() if k not in (
+            "cmap", "norm", "center", "annot", "vmin", "vmax", "robust",
+            "xticklabels", "yticklabels")}
+
+        if self.row_colors is not None:
+            self._plot_stripes(self.ax_row_colors, self.row_colors, yind,
+                               axis=0, **kws)
+        else:
+            sns.despine(self.ax_row_colors, left=True, bottom=True)
+
+        if self.col_colors is not None:
+            self._plot_stripes(self.ax_col_colors, self.col_colors, xind,
+                               axis=1, **kws)
+        else:
+            sns.despine(self.ax_col_colors, left=True, bottom=True)
+
+    def _plot_stripes(self, ax, colors, ind, axis, **kws):
+        n, levels = len(ind), len(colors.labels)
+        ind = np.asarray(ind)
+        if self.render == "mesh":
+            codes = colors.codes[:, ind]
+            codes = codes.T if axis == 0 else codes
+            sns.heatmap(codes, cmap=ListedColormap(colors.lut),
+                        vmin=0, vmax=len(colors.lut) - 1,
+                        cbar=False, ax=ax, xticklabels=False,
+                        yticklabels=False, **kws)
+        else:
+            bins = self.image_size[axis]
+            sample = ind[_bin_edges(n, bins)[:-1]]
+            rgba = colors.lut[colors.codes[:, sample]]
+            if axis == 0:
+                ax.imshow(rgba.swapaxes(0, 1), aspect="auto",
+                          interpolation="nearest", extent=(0, levels, n, 0))
+            else:
+                ax.imshow(rgba, aspect="auto",
+                          interpolation="nearest", extent=(0, n, levels, 0))
+            sns.despine(ax=ax, left=True, bottom=True)
+
+        if axis == 0:
+            self._set_image_ticks(ax, "x", colors.labels, rotation=90)
+            ax.set_yticks([])
+        else:
+            self._set_image_ticks(ax, "y", colors.labels)
+            ax.set_xticks([])
+            ax.yaxis.tick_right()
+
+    @staticmethod
+    def _set_image_ticks(ax, axis, labels, rotation=0):
+        if labels is None:
+            getattr(ax, f"set_{axis}ticks")([])
+            return
+        ticks = np.arange(len(labels)) + .5
+        getattr(ax, f"set_{axis}ticks")(ticks, labels, rotation=rotation)
+
+    def _auto_ticklabels(self, ax, index, ind, axis, setting):
+        """Set tick labels like the xticklabels/yticklabels of heatmap"""
+        set_ticks = getattr(ax, f"set_{axis}ticks")
+        n = len(ind)
+        if setting is False or n == 0:
+            set_ticks([])
+            return
+        if isinstance(setting, (bool, int, str)):
+            labels = _index_to_ticklabels(index)
+        else:
+            labels = setting
+        labels = np.asarray(labels, dtype=object)[ind]
+
+        if setting is True:
+            step = 1
+        elif isinstance(setting, int):
+            step = setting
+        else:
+            # skip labels that would overlap, as seaborn does with "auto"
+            bbox = ax.get_window_extent()
+            size = bbox.width if axis == "x" else bbox.height
+            size = size / self._figure.dpi * 72
+            fontsize = mpl.font_manager.FontProperties(
+                size=mpl.rcParams[f"{axis}tick.labelsize"]
+            ).get_size_in_points()
+            step = max(1, int(np.ceil(n * fontsize / size)))
+        ticks = np.arange(0, n, step)
+        set_ticks(ticks + .5, labels[ticks],
+                  rotation=90 if axis == "x" else 0)
+
+    def plot_matrix(self, colorbar_kws, xind, yind, **kws):
+        if self.render == "mesh":
+            return super().plot_matrix(colorbar_kws, xind, yind, **kws)
+
+        image = pool_matrix(self.data2d.to_numpy(), yind, xind,
+                            self.image_size, self.pooling)
+        image = np.ma.masked_invalid(image)
+
+        robust = kws.get("robust", False)
+        vmin, vmax = kws.get("vmin"), kws.get("vmax")
+        if robust:
+            vmin = np.percentile(image.compressed(), 2) \
+                if vmin is None else vmin
+            vmax = np.percentile(image.compressed(), 98) \
+                if vmax is None else vmax
+        cmap, norm = handle_cmap_norm(kws.get("cmap"), kws.get("norm"),
+                                      image, vmin, vmax, kws.get("center"))
+        if isinstance(cmap, str):
+            cmap = get_colormap(cmap)
+
+        n, m = len(yind), len(xind)
+        ax = self.ax_heatmap
+        ax.imshow(image, cmap=cmap, norm=norm, aspect="auto",
+                  interpolation="nearest", extent=(0, m, n, 0))
+        ax.set_xlim(0, m)
+        ax.set_ylim(n, 0)
+        sns.despine(ax=ax, left=True, bottom=True)
+        self._auto_ticklabels(ax, self.data2d.columns, xind, "x",
+                              kws.get("xticklabels", "auto"))
+        self._auto_ticklabels(ax, self.data2d.index, yind, "y",
+                              kws.get("yticklabels", "auto"))
+        ax.set(xlabel=_index_to_label(self.data2d.columns) or "",
+               ylabel=_index_to_label(self.data2d.index) or "")
+        ax.yaxis.set_ticks_position('right')
+        ax.yaxis.set_label_position('right')
+        self._figure.tight_layout(h_pad=.02, w_pad=.02)
+
+
+def _clustermap(data, *, render="mesh", image_size=None, pooling="mean",
+                pivot_kws=None, method='average', metric='euclidean',
+                z_score=None, standard_scale=None, figsize=(10, 10),
+                cbar_kws=None, row_cluster=True, col_cluster=True,
+                row_linkage=None, col_linkage=None,
+                row_colors=None, col_colors=None, mask=None,
+                dendrogram_ratio=.2, colors_ratio=0.03,
+                cbar_pos=(.02, .8, .05, .18), tree_kws=None,
+                **kwargs):
+    """The same as :func:`seaborn.clustermap` with :class:`_AnnoClusterGrid`"""
+    plotter = _AnnoClusterGrid(data, render=render, image_size=image_size,
+                               pooling=pooling,
+                               pivot_kws=pivot_kws, figsize=figsize,
+                               row_colors=row_colors, col_colors=col_colors,
+                               z_score=z_score, standard_scale=standard_scale,
+                               mask=mask, dendrogram_ratio=dendrogram_ratio,
+                               colors_ratio=colors_ratio, cbar_pos=cbar_pos)
+
+    return plotter.plot(metric=metric, method=method,
+                        colorbar_kws=cbar_kws,
+                        row_cluster=row_cluster, col_cluster=col_cluster,
+                        row_linkage=row_linkage, col_linkage=col_linkage,
+                        tree_kws=tree_kws, **kwargs)
 
 
 def anno_clustermap(
-        data: pd.DataFrame,
+        data: pd.DataFrame | np.ndarray,
+        row_anno: pd.DataFrame = None,
+        col_anno: pd.DataFrame = None,
         # define row colors
         row_colors: str | List[str] = None,
         row_colors_cmap: str | List[str] = None,
@@ -37,14 +384,29 @@ def anno_clustermap(
         cbar_title: str = None,
         row_cluster=True,
         col_cluster=True,
+        cluster_backend: str = "seaborn",
+        n_clusters: int = 1000,
+        n_jobs: int = None,
+        random_state: int = 0,
+        heatmap_render: str = "mesh",
+        image_size: Tuple[int, int] = None,
+        pooling: str = "mean",
         **kwargs,
 ) -> sns.matrix.ClusterGrid:
     """Color or label annotated clustermap
 
     Parameters
     ----------
-    data : pd.DataFrame
-        A dataframe, multi-levels annotations should store in MultiIndex
+    data : pd.DataFrame, np.ndarray
+        A dataframe, multi-levels annotations should store in MultiIndex.
+        Or a 2D array (a :class:`numpy.memmap` is fine), with the
+        annotations in `row_anno` and `col_anno`
+    row_anno : pd.DataFrame
+        The annotations of rows, one column per level,
+        replace the index of `data`
+    col_anno : pd.DataFrame
+        The annotations of columns, one column per level,
+        replace the columns of `data`
     row_label : str, array-like of str
         The index level used for y-axis label
     col_label : str, array-like of str
@@ -84,9 +446,54 @@ def anno_clustermap(
         Set the title for colorbar
     row_cluster : bool
     col_cluster : bool
+    cluster_backend : {"seaborn", "chunked", "kmeans"}, default: "seaborn"
+        How the linkage is computed,
+
+        - "seaborn": Let :func:`seaborn.clustermap` do the clustering
+        - "chunked": Exact clustering, the distance matrix is computed
+          block by block in multiple threads, only the condensed
+          distances are kept in memory
+        - "kmeans": Aggregate rows/columns into `n_clusters` centroids
+          with mini-batch k-means, cluster the centroids and expand
+          them back, suitable for matrix with 50k+ rows
+
+    n_clusters : int, default: 1000
+        The number of centroids when cluster_backend="kmeans"
+    n_jobs : int
+        The number of threads to compute distance, default to all CPUs
+    random_state : int
+        The seed for k-means
+    heatmap_render : {"mesh", "image"}, default: "mesh"
+        Draw the heatmap with one quad per cell ("mesh"), or as a single
+        image pooled to the pixel resolution of the heatmap ("image"),
+        the color stripes are also drawn as image.
+        Use "image" for large matrix to keep the drawing fast and the
+        file size small
+    image_size : (int, int)
+        The (rows, columns) resolution of the image,
+        default to the size of heatmap in pixels
+    pooling : {"mean", "max"}, default: "mean"
+        How to reduce the cells that fall in the same pixel
     kwargs :
         Pass to :func:`seaborn.clustermap`
 
+    Notes
+    -----
+    For large matrix, pass a float32 array or memmap with `row_anno` and
+    `col_anno`, and use ``heatmap_render="image"``. The matrix is never
+    copied and keeps its dtype through clustering and rendering
+    (except when z_score, standard_scale or an order is applied).
+    Beyond the input, the peak memory is bounded by the sum of
+
+    - 3 bytes per cell while seaborn builds its NaN mask,
+      1 byte per cell of it is kept
+    - The pooling of the image, one block of at most 2^24 cells at a
+      time, about 14 bytes per cell for float32 (18 for float64)
+      with ``pooling="mean"``: the block, its copy with NaN as 0,
+      the valid mask and its counts, and half of it with "max"
+    - The clustering, n * (n - 1) / 2 float64 for
+      ``cluster_backend="chunked"``, or n_clusters * n_columns float64
+      and a few blocks of 2^22 distances for ``cluster_backend="kmeans"``
 
     """
     row_colors_cmap = "tab20" if row_colors_cmap is None else row_colors_cmap
@@ -95,9 +502,19 @@ def anno_clustermap(
     legend_kw = set_default(legend_kw, {})
     cbar_kw = set_default(cbar_kw, {})
 
-    # split the dataframe
-    data = data.copy()
-    raw_data = data.to_numpy()
+    # split the dataframe into values and annotations, no copy is made
+    if isinstance(data, pd.DataFrame):
+        row_info = data.index.to_frame(index=False)
+        col_info = data.columns.to_frame(index=False)
+        values = data.to_numpy()
+    else:
+        row_info = pd.DataFrame(index=pd.RangeIndex(data.shape[0]))
+        col_info = pd.DataFrame(index=pd.RangeIndex(data.shape[1]))
+        values = data
+    if row_anno is not None:
+        row_info = row_anno.reset_index(drop=True)
+    if col_anno is not None:
+        col_info = col_anno.reset_index(drop=True)
 
     if isinstance(row_colors, str):
         row_colors = [row_colors]
@@ -106,30 +523,33 @@ def anno_clustermap(
         col_colors = [col_colors]
 
     if (row_colors is not None) & (row_colors_order is not None):
-        # data.reorder_levels(list(row_colors_order.keys()), axis=0)
-        for name, labels in row_colors_order.items():
-            data = data.reindex(axis="index", level=name, labels=labels)
+        row_info, ix = _reorder_info(row_info, row_colors_order)
+        values = values[ix]
 
     if (col_colors is not None) & (col_colors_order is not None):
-        # data.reorder_levels(list(col_colors_order.keys()), axis=1)
-        for name, labels in col_colors_order.items():
-            data = data.reindex(axis="column", level=name, labels=labels)
+        col_info, ix = _reorder_info(col_info, col_colors_order)
+        values = values[:, ix]
 
     if (row_colors is not None) & (row_colors_label is not None):
-        data = data.rename_axis(index=row_colors_label)
+        row_info = row_info.rename(columns=row_colors_label)
         row_colors = [row_colors_label[label] for label in row_colors]
 
     if (col_colors is not None) & (col_colors_label is not None):
-        data = data.rename_axis(columns=col_colors_label)
+        col_info = col_info.rename(columns=col_colors_label)
         col_colors = [col_colors_label[label] for label in col_colors]
 
-    row_info = data.index.to_frame(index=False)
-    col_info = data.columns.to_frame(index=False)
     row_label = row_info[row_label] if row_label is not None else None
     col_label = col_info[col_label] if col_label is not None else None
-    plot_data = pd.DataFrame(raw_data, index=row_label, columns=col_label)
+    plot_data = pd.DataFrame(values, index=row_label, columns=col_label,
+                             copy=False)
 
     clustermap_kwargs = dict(cmap=heat_cmap, cbar_pos=None, **kwargs)
+    if cluster_backend != "seaborn":
+        clustermap_kwargs.update(_compute_linkage(
+            plot_data, cluster_backend,
+            row_cluster=row_cluster, col_cluster=col_cluster,
+            n_clusters=n_clusters, n_jobs=n_jobs,
+            random_state=random_state, **kwargs))
     row_colors_mapper = None
     col_colors_mapper = None
     row_legend_contents = None
@@ -138,28 +558,24 @@ def anno_clustermap(
     if row_colors is not None:
         info = row_info[row_colors]
         row_legend_contents = \
-            {rc: info[rc].unique().flatten() for rc in row_colors}
-        color_array, legend_labels, legend_colors = \
-            cat_colors(info.to_numpy().flatten(), cmap=row_colors_cmap)
-        # convert to hex to ensure str dtype
-        hex_colors = [to_hex(c) for c in legend_colors]
-        row_colors_mapper = dict(zip(legend_labels, hex_colors))
-        clustermap_kwargs["row_colors"] = info.replace(row_colors_mapper)
+            {rc: info[rc].dropna().unique().flatten() for rc in row_colors}
+        clustermap_kwargs["row_colors"], row_colors_mapper = \
+            _annotation_colors(info, row_colors_cmap)
 
     if col_colors is not None:
         info = col_info[col_colors]
         col_legend_contents = \
-            {cc: info[cc].unique().flatten() for cc in col_colors}
-        color_array, legend_labels, legend_colors = \
-            cat_colors(info.to_numpy().flatten(), cmap=col_colors_cmap)
-        hex_colors = [to_hex(c) for c in legend_colors]
-        col_colors_mapper = dict(zip(legend_labels, hex_colors))
-        clustermap_kwargs["col_colors"] = info.replace(col_colors_mapper)
-
-    g = sns.clustermap(plot_data,
-                       col_cluster=col_cluster,
-                       row_cluster=row_cluster,
-                       **clustermap_kwargs)
+            {cc: info[cc].dropna().unique().flatten() for cc in col_colors}
+        clustermap_kwargs["col_colors"], col_colors_mapper = \
+            _annotation_colors(info, col_colors_cmap)
+
+    g = _clustermap(plot_data,
+                    render=heatmap_render,
+                    image_size=image_size,
+                    pooling=pooling,
+                    col_cluster=col_cluster,
+                    row_cluster=row_cluster,
+                    **clustermap_kwargs)
 
     # plot row colors legend
     legend_options = dict(
@@ -234,7 +650,7 @@ def anno_clustermap(
 
         mesh = None
         for i in g.ax_heatmap.get_children():
-            if isinstance(i, QuadMesh):
+            if isinstance(i, (QuadMesh, AxesImage)):
                 mesh = i
         g.cbar = Colorbar(mesh, **cbar_options)
 
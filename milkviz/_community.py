@@ -0,0 +1,135 @@
+"""Community detection and aggregation for large graphs"""
+from __future__ import annotations
+
+import numpy as np
+
+# The fraction of nodes updated in each round of label propagation
+UPDATE_RATE = 0.8
+
+
+def label_propagation(n, src, dst, weight=None, max_iter=100, tol=1e-3,
+                      seed=0):
+    """Detect communities by label propagation
+
+    Each node takes the label with the largest total edge weight among its
+    neighbors, ties are broken randomly. Labels are updated on a random
+    subset of the nodes in each round to avoid oscillation.
+
+    Parameters
+    ----------
+    n : int
+        The number of nodes
+    src, dst : array-like of int
+        The index of nodes on the two ends of edges
+    weight : array-like
+        The weight of edges, default to 1
+    max_iter : int
+    tol : float
+        Stop when fewer than this fraction of nodes want to change label
+    seed : int
+
+    Returns
+    -------
+    np.ndarray
+        The community of each node, numbered from the largest community
+
+    """
+    rng = np.random.default_rng(seed)
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    weight = np.ones(len(src)) if weight is None \
+        else np.asarray(weight, dtype=float)
+    keep = src != dst
+    heads = np.concatenate([src[keep], dst[keep]])
+    tails = np.concatenate([dst[keep], src[keep]])
+    weight = np.tile(weight[keep], 2)
+    if len(heads) == 0:
+        # every node is a community of its own
+        return np.arange(n)
+
+    label = np.arange(n)
+    for _ in range(max_iter):
+        key, inverse = np.unique(heads * n + label[tails],
+                                 return_inverse=True)
+        score = np.bincount(inverse, weight)
+        node, candidate = np.divmod(key, n)
+        # the max score of each node, with a tiny noise to break ties
+        starts = np.flatnonzero(np.r_[True, node[1:] != node[:-1]])
+        noisy = score * (1 + 1e-9 * rng.random(len(score)))
+        top = np.maximum.reduceat(noisy, starts)
+        winner = np.flatnonzero(
+            noisy == np.repeat(top, np.diff(np.r_[starts, len(node)])))
+        best, best_score = label.copy(), np.zeros(n)
+        best[node[winner]] = candidate[winner]
+        best_score[node[winner]] = score[winner]
+        # the current label may tie with the best one
+        current = np.zeros(n)
+        own = candidate == label[node]
+        current[node[own]] = score[own]
+        if np.count_nonzero(best_score > current) <= tol * n:
+            break
+        label = np.where((best != label) & (rng.random(n) < UPDATE_RATE),
+                         best, label)
+    return rank_by_size(label)
+
+
+def rank_by_size(community):
+    """Renumber the communities from 0, the largest first"""
+    uniq, community, counts = np.unique(community, return_inverse=True,
+                                        return_counts=True)
+    rank = np.empty(len(uniq), dtype=np.intp)
+    rank[np.argsort(-counts, kind="stable")] = np.arange(len(uniq))
+    return rank[community]
+
+
+def _mean_by(group, values, k):
+    """The mean of numeric values in each group,
+    the first value of each group for other arrays"""
+    if values is None or isinstance(values, str):
+        return values
+    values = np.asarray(values)
+    if values.ndim == 0:
+        return values
+    if values.dtype.kind not in "biuf":
+        _, first = np.unique(group, return_index=True)
+        return values[first]
+    counts = np.bincount(group, minlength=k)
+    return np.bincount(group, values, minlength=k) / np.maximum(counts, 1)
+
+
+def collapse_graph(community, src, dst, nodes_color=None, edges_width=None,
+                   edges_color=None):
+    """Collapse each community into one node
+
+    Returns
+    -------
+    counts : np.ndarray
+        The number of members of each community
+    nodes_color :
+        The mean node value of each community
+    src, dst : np.ndarray
+        The edges between communities
+    edges_width : np.ndarray
+        The number of edges between two communities,
+        or the sum of edges_width if provided
+    edges_color :
+        The mean edge value between two communities
+
+    """
+    k = community.max() + 1 if len(community) else 0
+    counts = np.bincount(community, minlength=k)
+    nodes_color = _mean_by(community, nodes_color, k)
+
+    a, b = community[src], community[dst]
+    between = a != b
+    lo = np.minimum(a, b)[between]
+    hi = np.maximum(a, b)[between]
+    key, group = np.unique(lo * k + hi, return_inverse=True)
+    width = np.ones(len(src)) if edges_width is None \
+        else np.broadcast_to(np.asarray(edges_width, dtype=float), len(src))
+    width = np.bincount(group, width[between], minlength=len(key))
+    if edges_color is not None and not isinstance(edges_color, str):
+        edges_color = np.asarray(edges_color)
+        if edges_color.ndim > 0:
+            edges_color = _mean_by(group, edges_color[between], len(key))
+    return counts, nodes_color, key // k, key % k, width, edges_color
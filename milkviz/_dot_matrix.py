@@ -9,6 +9,7 @@ from matplotlib.colors import Normalize, is_color_like
 
 from legendkit import SizeLegend, Colorbar
 from milkviz.utils import set_default
+from ._scale import StreamingStats, get_stats
 
 
 class DotHeatmap:
@@ -53,6 +54,10 @@ class DotHeatmap:
 
         self.dot_cmap = set_default(dot_cmap, "RdBu")
         self.matrix_cmap = set_default(matrix_cmap, "YlGn")
+        if isinstance(dot_norm, StreamingStats):
+            dot_norm = dot_norm.norm()
+        if isinstance(matrix_norm, StreamingStats):
+            matrix_norm = matrix_norm.norm()
         self.dot_norm = dot_norm
         self.matrix_norm = matrix_norm
 
@@ -95,9 +100,11 @@ class DotHeatmap:
         else:
             circ_colors = np.repeat("C0", dot_size.size)
 
-        if size_norm is None:
-            size_norm = Normalize()
-            size_norm.autoscale(dot_size)
+        self.size_stats = get_stats(
+            size_norm if isinstance(size_norm, StreamingStats) else dot_size)
+        if not isinstance(size_norm, Normalize):
+            size_norm = self.size_stats.norm()
+        self.size_norm = size_norm
 
         if dot_patch == "circle":
             circ_size = size_norm(dot_size) * (sizes[1] - sizes[0]) + sizes[0]
@@ -160,10 +167,13 @@ class DotHeatmap:
             loc="out right upper",
         )
         options = {**options, **self.dot_size_legend_kw}
+        values = self.size_stats.legend_values()
+        sizes = self.size_norm(values) * (self.sizes[1] - self.sizes[0]) \
+            + self.sizes[0]
         self.dot_size_legend = SizeLegend(
-            sizes=self.sizes,
+            sizes=sizes,
             ax=self.ax,
-            array=self.dot_size.flatten(),
+            array=values,
             dtype=self.dtype,
             **options
         )
@@ -239,7 +249,8 @@ def dot_heatmap(
     sizes : tuple, default: (1, 200)
         The range of size to plot
     size_norm :
-        A Normalize instance to scale sizes
+        A Normalize instance to scale sizes, or a :class:`StreamingStats`
+        of the sizes
     dtype :
     dot_patch : {"circle", "pie"}
         The style of dot
@@ -254,7 +265,11 @@ def dot_heatmap(
     matrix_cmap : colormap, default: "YlGn"
         The colormap for matrix
     dot_norm :
+        A Normalize instance to map dot_hue to colors,
+        or a :class:`StreamingStats` of the hue
     matrix_norm :
+        A Normalize instance to map matrix_hue to colors,
+        or a :class:`StreamingStats` of the hue
     dot_size_legend_kw : dict
     dot_hue_cbar_kw : dict
     matrix_cbar_kw : dict
@@ -0,0 +1,119 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from milkviz.utils import set_default
+from ._graph import graph, _edge_index, _compute_layout
+
+
+def _render_frame(edges, pos, limits, figsize, dpi, path, graph_kw):
+    """Draw one snapshot on its own Agg canvas, pyplot is not involved"""
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    graph(edges, pos=pos, ax=ax, **graph_kw)
+    ax.set_xlim(*limits[0])
+    ax.set_ylim(*limits[1])
+    if path is None:
+        return fig
+    fig.savefig(path)
+    return path
+
+
+def dynamic_graph(
+        snapshots,
+        nodes=None,
+        iterations=5,
+        layout_kw=None,
+        frame_kw=None,
+        save=None,
+        figsize=None,
+        dpi=100,
+        n_jobs=None,
+        return_pos=False,
+        **kwargs,
+):
+    """Graph layout of a time-evolving graph
+
+    The first snapshot is laid out with the "fast_fr" layout,
+    every following snapshot starts from the positions in the previous one
+    and only runs a few iterations, so the nodes stay in place between frames.
+    Once all layouts are known, the frames are rendered in parallel.
+
+    Parameters
+    ----------
+    snapshots : list
+        The edges of each timepoint, in any form accepted by :func:`graph`
+    nodes : array-like
+        The graph nodes, shared by all snapshots
+    iterations : int, default: 5
+        The number of layout iterations from the previous positions
+    layout_kw : dict
+        Pass to the "fast_fr" layout of the first snapshot
+    frame_kw : list of dict
+        The arguments of :func:`graph` for each frame,
+        like the nodes_color at each timepoint
+    save : str
+        A path with a placeholder for the frame number,
+        like "frames/{:03d}.png", the frames are saved instead of returned
+    figsize : tuple
+    dpi : int, default: 100
+    n_jobs : int
+        The number of threads to render frames, default to the number of CPUs
+    return_pos : bool, default: False
+        If True, also return the positions of nodes in each frame
+    **kwargs :
+        Pass to :func:`graph` for every frame
+
+    Returns
+    -------
+    list of Figure, or list of saved paths if save is provided,
+    and a list of dict of node to position if return_pos is True
+
+    """
+    layout_kw = set_default(layout_kw, {})
+    frame_kw = set_default(frame_kw, [{}] * len(snapshots))
+    if len(frame_kw) != len(snapshots):
+        raise ValueError(f"Got {len(frame_kw)} frame_kw for "
+                         f"{len(snapshots)} snapshots")
+
+    positions = []
+    # the last known position of every node seen so far,
+    # a node that comes back starts from where it left
+    known = {}
+    for edges in snapshots:
+        labels, src, dst, _, _ = _edge_index(edges, nodes)
+        if len(known) == 0:
+            kw = layout_kw
+        else:
+            kw = {**layout_kw, "pos": known, "iterations": iterations}
+        coords = _compute_layout(labels, src, dst, "fast_fr", kw)
+        pos = dict(zip(labels, coords))
+        known.update(pos)
+        positions.append(pos)
+
+    # the same view for all frames
+    coords = np.vstack([np.array(list(p.values())).reshape(-1, 2)
+                        for p in positions])
+    lo, hi = coords.min(axis=0), coords.max(axis=0)
+    margin = (hi - lo) * 0.05
+    limits = list(zip(lo - margin, hi + margin))
+
+    if save is not None:
+        folder = os.path.dirname(save)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+    n_jobs = os.cpu_count() if n_jobs is None else n_jobs
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        frames = list(pool.map(
+            lambda i: _render_frame(
+                snapshots[i], positions[i], limits, figsize, dpi,
+                None if save is None else save.format(i),
+                {**kwargs, **frame_kw[i]}),
+            range(len(snapshots))))
+    if return_pos:
+        return frames, positions
+    return frames
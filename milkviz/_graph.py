@@ -1,12 +1,261 @@
+import os
+import threading
+
 import matplotlib as mpl
 import numpy as np
 from matplotlib import pyplot as plt
-from matplotlib.axes import Axes
+from matplotlib.collections import LineCollection, PathCollection, \
+    PolyCollection
 from matplotlib.colors import Normalize
+from matplotlib.path import Path
+from matplotlib.transforms import Affine2D
 from seaborn import despine
 
 from legendkit import Colorbar
 from milkviz.utils import set_default, get_colormap
+from ._community import collapse_graph, label_propagation, rank_by_size
+from ._labels import CulledLabels
+from ._layout import fast_fr_layout, layout_key
+from ._scale import get_norm
+
+
+def _edge_index(edges, nodes=None):
+    """The node labels, and the edges as node indices
+
+    Returns labels, src, dst, the values stored in a sparse adjacency
+    matrix and the mask of the stored entries that are edges
+    (None for other inputs). A symmetric adjacency matrix is
+    undirected, only its upper triangle is used.
+    """
+    if hasattr(edges, "tocsr"):
+        adj = edges.tocsr()
+        n = adj.shape[0]
+        src = np.repeat(np.arange(n), np.diff(adj.indptr))
+        dst = adj.indices.astype(np.intp)
+        data = adj.data
+        kept = np.ones(len(data), dtype=bool)
+        labels = list(range(n)) if nodes is None else list(nodes)
+        if len(labels) != n:
+            raise ValueError(f"Got {len(labels)} nodes for an adjacency "
+                             f"matrix of {n} nodes")
+        if (adj != adj.T).nnz == 0:
+            kept = src <= dst
+            src, dst, data = src[kept], dst[kept], data[kept]
+        return labels, src, dst, data, kept
+
+    arr = np.asarray(edges) if isinstance(edges, np.ndarray) else None
+    if arr is not None and arr.dtype.kind in "iu":
+        arr = arr.reshape(-1, 2).astype(np.intp)
+        n = arr.max() + 1 if len(arr) else 0
+        if nodes is None:
+            labels = list(range(n))
+        else:
+            labels = list(nodes)
+            if len(labels) < n:
+                raise ValueError(f"The edges refer to node {n - 1}, "
+                                 f"but only {len(labels)} nodes are given")
+        return labels, arr[:, 0], arr[:, 1], None, None
+
+    index = {}
+    if nodes is not None:
+        for node in nodes:
+            index.setdefault(node, len(index))
+    ix = np.array([(index.setdefault(u, len(index)),
+                    index.setdefault(v, len(index))) for u, v in edges],
+                  dtype=np.intp).reshape(-1, 2)
+    return list(index), ix[:, 0], ix[:, 1], None, None
+
+
+def _nx_graph(labels, src, dst):
+    import networkx as nx
+
+    G = nx.Graph()
+    G.add_nodes_from(labels)
+    G.add_edges_from(zip([labels[i] for i in src], [labels[i] for i in dst]))
+    return G
+
+
+def _compute_layout(labels, src, dst, layout, layout_kw):
+    """Compute the positions of nodes, an array in the order of labels"""
+    if layout == "fast_fr":
+        kwargs = dict(layout_kw)
+        init_pos = kwargs.pop("pos", None)
+        if init_pos is not None:
+            init_pos = np.array([init_pos.get(node, (np.nan, np.nan))
+                                 for node in labels], dtype=float)
+        return fast_fr_layout(len(labels), src, dst, pos=init_pos, **kwargs)
+
+    try:
+        import networkx as nx
+    except ImportError:
+        raise ImportError("Try `pip install networkx`")
+    G = _nx_graph(labels, src, dst)
+    if layout == "bipartite_layout":
+        top = [labels[i] for i in np.unique(src)]
+        pos = nx.bipartite_layout(G, top, **layout_kw)
+    else:
+        pos = getattr(nx.drawing.layout, layout).__call__(G, **layout_kw)
+    return np.array([pos[node] for node in labels], dtype=float)
+
+
+def _cached_layout(labels, src, dst, layout, layout_kw, layout_cache):
+    """Read the layout from the cache directory, or compute and save it"""
+    key, order = layout_key(labels, src, dst, layout, layout_kw)
+    path = os.path.join(layout_cache, f"{key}.npy")
+    if os.path.exists(path):
+        coords = np.empty((len(labels), 2))
+        coords[order] = np.load(path)
+        return coords
+
+    coords = _compute_layout(labels, src, dst, layout, layout_kw)
+    os.makedirs(layout_cache, exist_ok=True)
+    # write then rename, a reader never sees a partial file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        np.save(f, coords[order])
+    os.replace(tmp, path)
+    return coords
+
+
+def _stored_entries(values, kept, name):
+    """Select the per-edge values of the stored entries that are edges"""
+    if values is None or isinstance(values, str) or np.ndim(values) == 0:
+        return values
+    if len(values) != len(kept):
+        raise ValueError(f"Got {len(values)} {name} for an adjacency "
+                         f"matrix of {len(kept)} stored entries")
+    return np.asarray(values)[kept]
+
+
+def _subset(values, ix):
+    """Select the elements of a per-node or per-edge array"""
+    if values is None or isinstance(values, str) or np.ndim(values) == 0:
+        return values
+    return np.asarray(values)[ix]
+
+
+def _parse_arc3(connectionstyle):
+    """The rad of an arc3 connectionstyle, 0 for straight edges"""
+    if connectionstyle is None:
+        return 0.
+    name, _, args = connectionstyle.replace(" ", "").partition(",")
+    if name != "arc3":
+        raise ValueError(f"Only 'arc3' connectionstyle is supported, "
+                         f"got '{connectionstyle}'")
+    options = dict(arg.split("=") for arg in args.split(",") if arg)
+    return float(options.get("rad", 0.))
+
+
+class _Arrowheads(PolyCollection):
+    """Triangles in points at the targets of edges
+
+    The direction of the curve at each target is taken in display space
+    at draw time, so the heads follow the limits, the size of the figure
+    and the dpi of the output.
+
+    Parameters
+    ----------
+    ctrl_xy : np.ndarray
+        The (n, 2) control points of the edges in data coordinates,
+        the heads point from them to the offsets
+    radius : np.ndarray
+        The radius of the target nodes in points, the heads stop there
+    width : np.ndarray
+        The width of edges in points, the heads grow with it
+    arrowsize : float
+    **kwargs :
+        Pass to :class:`matplotlib.collections.PolyCollection`
+
+    """
+
+    def __init__(self, ctrl_xy, radius, width, arrowsize=10, **kwargs):
+        super().__init__([], **kwargs)
+        self.ctrl_xy = np.asarray(ctrl_xy, dtype=float)
+        self.radius = np.asarray(radius, dtype=float)[:, np.newaxis]
+        self.width = np.asarray(width, dtype=float)[:, np.newaxis]
+        self.arrowsize = arrowsize
+
+    def _heads(self):
+        trans = self.get_offset_transform()
+        direction = trans.transform(self.get_offsets()) \
+            - trans.transform(self.ctrl_xy)
+        length = np.hypot(direction[:, 0], direction[:, 1])
+        direction /= np.where(length == 0, 1, length)[:, np.newaxis]
+        normal = np.column_stack([-direction[:, 1], direction[:, 0]])
+        # the head grows with the edge width, like a stroked arrowhead
+        head = -direction * self.radius
+        base = head - direction * (0.4 * self.arrowsize + self.width)
+        half_width = normal * (0.2 * self.arrowsize + self.width)
+        return np.stack([head, base + half_width, base - half_width], axis=1)
+
+    def draw(self, renderer):
+        self.set_verts(self._heads())
+        super().draw(renderer)
+
+
+def _draw_edges(ax, src_xy, dst_xy, width, color, cmap, vmin, vmax,
+                connectionstyle, arrowstyle, target_size, arrowsize=10):
+    """Draw all edges as one collection
+
+    The curved edges are quadratic Bézier curves with the same control
+    points as :class:`matplotlib.patches.ConnectionStyle.Arc3`.
+    The arrowheads are triangles in points at the target nodes, drawn as
+    one :class:`_Arrowheads` collection.
+
+    Returns the edges collection, a mappable if color is numeric.
+    """
+    rad = _parse_arc3(connectionstyle)
+    mapped = not isinstance(color, str) and \
+        np.asarray(color).dtype.kind in "biuf"
+    if mapped:
+        norm = Normalize(vmin=vmin, vmax=vmax)
+        color_options = dict(array=np.asarray(color), cmap=cmap, norm=norm)
+    else:
+        color_options = dict(edgecolors=color)
+
+    if rad == 0:
+        ctrl_xy = src_xy
+        edges = LineCollection(np.stack([src_xy, dst_xy], axis=1),
+                               linewidths=width, **color_options)
+    else:
+        d = dst_xy - src_xy
+        ctrl_xy = (src_xy + dst_xy) / 2 + rad * np.column_stack(
+            [d[:, 1], -d[:, 0]])
+        codes = np.array([Path.MOVETO, Path.CURVE3, Path.CURVE3],
+                         dtype=Path.code_type)
+        paths = [Path(v, codes) for v in
+                 np.stack([src_xy, ctrl_xy, dst_xy], axis=1)]
+        edges = PathCollection(paths, facecolors="none",
+                               linewidths=width, **color_options)
+    edges.set_zorder(1)
+    ax.add_collection(edges)
+    ax.update_datalim(np.vstack([src_xy, ctrl_xy, dst_xy]))
+    ax.autoscale_view()
+
+    if arrowstyle not in (None, "-") and len(dst_xy) > 0:
+        # stop at the border of the target node, the size is in points^2
+        radius = np.broadcast_to(np.sqrt(target_size) / 2, len(dst_xy))
+        width = np.broadcast_to(width, len(dst_xy))
+        if mapped:
+            arrow_options = color_options
+        else:
+            arrow_options = dict(facecolors=color)
+        transform = Affine2D().scale(1 / 72) + ax.figure.dpi_scale_trans
+        try:
+            arrows = _Arrowheads(ctrl_xy, radius, width, arrowsize,
+                                 offsets=dst_xy,
+                                 offset_transform=ax.transData,
+                                 transform=transform, linewidths=0,
+                                 **arrow_options)
+        except AttributeError:  # matplotlib < 3.6
+            arrows = _Arrowheads(ctrl_xy, radius, width, arrowsize,
+                                 offsets=dst_xy,
+                                 transOffset=ax.transData,
+                                 transform=transform, linewidths=0,
+                                 **arrow_options)
+        arrows.set_zorder(1)
+        ax.add_collection(arrows, autolim=False)
+    return edges
 
 
 def graph(
@@ -29,28 +278,47 @@ def graph(
         linewidth=(1, 10),
         connectionstyle='arc3,rad=0.2',
         layout="kamada_kawai_layout",
+        layout_kw=None,
+        pos=None,
+        layout_cache=None,
+        return_pos=False,
+        label_priority=None,
+        collapse=False,
+        expand=None,
         arrowstyle="-",
         ax=None,
-) -> Axes:
+):
     """Graph layout
 
     Parameters
     ----------
     nodes : array-like
-        The graph nodes, a list of nodes
-    edges : array-like
-        The graph data, a list of (source, target)
+        The graph nodes, a list of nodes. If edges are node indices,
+        these are the labels of the indices
+    edges : array-like, np.ndarray, scipy.sparse matrix
+        The graph data, a list of (source, target),
+        or an (m, 2) integer array of node indices,
+        or a sparse (n, n) adjacency matrix, every stored entry is an edge.
+        A symmetric matrix is taken as an undirected graph,
+        only the entries in its upper triangle are edges,
+        the per-edge arrays are selected the same way
     nodes_size : array-like
-        The size of nodes
+        The size of nodes, in the order of nodes
     nodes_color :
-        The color of nodes
+        The color of nodes, in the order of nodes
     edges_width :
-        The width array that map to edge width
+        The width array that map to edge width, in the order of edges.
+        For a sparse adjacency matrix, the values of all stored entries
+        in CSR order, the stored values are used if not provided
     edges_color :
-        The color array that map to edges color
+        The color array that map to edges color, in the order of edges.
+        For a sparse adjacency matrix, the values of all stored entries
+        in CSR order
     nodes_size_range :
         Use to remap the nodes size,
-        overwrite the min, max of nodes_size array
+        overwrite the min, max of nodes_size array.
+        Every range can also be a Normalize or a :class:`StreamingStats`,
+        like the percentile-clipped ``stats.norm(clip=(1, 99))``
     nodes_color_range :
         Use to remap the nodes colors,
         overwrite the min, max of nodes_color array
@@ -77,57 +345,104 @@ def graph(
     connectionstyle :
         Pass the connectionstyle parameter to create curved arc of rounding
         radius rad. For example, connectionstyle='arc3,rad=0.2'.
-        See :class:`matplotlib.patches.ConnectionStyle` and
-        :class:`matplotlib.patches.FancyArrowPatch` for more info.
-    layout : See
-        :func:`networkx.drawing.layout`
-    arrowstyle : For directed graphs and arrows==True defaults to ‘-|>’, See
-        :class:`matplotlib.patches.ArrowStyle` for more options.
+        Only "arc3" is supported, all edges are drawn as one collection.
+        See :class:`matplotlib.patches.ConnectionStyle` for more info.
+    layout : str
+        "fast_fr" to use the built-in multilevel Fruchterman-Reingold
+        layout, which scales to large graph,
+        or any layout in :func:`networkx.drawing.layout`
+    layout_kw : dict
+        Pass to the layout function. For "fast_fr", `iterations` and `seed`
+        can be set, `pos` is a mapping of node to position
+        to warm-start from
+    pos : dict
+        A mapping of node to position, if provided,
+        the layout will not be computed
+    layout_cache : str, path-like
+        A directory to cache the layout on disk, the layout of the same
+        nodes, edges, layout and layout_kw is only computed once
+    return_pos : bool, default: False
+        If True, also return the positions of nodes
+    label_priority : {"size", "degree"} or array-like
+        By default, all nodes are labeled. If set, only the labels that
+        don't overlap are drawn, the labels of larger nodes, nodes with more
+        edges or higher scores (an array in the order of nodes) come first.
+        The labels are re-selected when zooming
+    collapse : bool or array-like, default: False
+        Draw each community as one node, for very large graph.
+        If True, the communities are detected by label propagation,
+        or an array of the community of each node. Communities are
+        numbered from 0, the largest first. The nodes are sized by the
+        number of members and colored by the mean of nodes_color,
+        the edges are weighted by the number of edges
+        (or the sum of edges_width) between communities
+    expand : int
+        With collapse, only draw the nodes and edges within this community
+    arrowstyle : str, default: "-"
+        Any style other than "-" draws a triangle arrowhead at the target
+        of each edge
     ax :
 
-    """
-    try:
-        import networkx as nx
-    except ImportError:
-        raise ImportError("Try `pip install networkx`")
+    Returns
+    -------
+    Axes, or (Axes, dict of node to position) if return_pos is True
 
+    """
     node_cbar_kw = set_default(node_cbar_kw, {})
     edge_cbar_kw = set_default(edge_cbar_kw, {})
+    layout_kw = set_default(layout_kw, {})
 
-    G = nx.Graph()
-    G.add_edges_from(edges)
-    if nodes is not None:
-        G.add_nodes_from(nodes)
+    labels, src, dst, weight, kept = _edge_index(edges, nodes)
+    if kept is not None:
+        edges_width = _stored_entries(edges_width, kept, "edges_width")
+        edges_color = _stored_entries(edges_color, kept, "edges_color")
+    if edges_width is None:
+        edges_width = weight
+    if collapse is not False and collapse is not None:
+        if collapse is True:
+            community = label_propagation(len(labels), src, dst)
+        else:
+            community = rank_by_size(np.asarray(collapse))
+        if expand is None:
+            (nodes_size, nodes_color, src, dst,
+             edges_width, edges_color) = collapse_graph(
+                community, src, dst, nodes_color, edges_width, edges_color)
+            labels = list(range(len(nodes_size)))
+        else:
+            members = np.flatnonzero(community == expand)
+            if len(members) == 0:
+                raise ValueError(f"Community {expand} does not exist")
+            index = np.full(len(labels), -1)
+            index[members] = np.arange(len(members))
+            inside = (index[src] >= 0) & (index[dst] >= 0)
+            nodes_size, nodes_color = (
+                _subset(v, members) for v in (nodes_size, nodes_color))
+            edges_width, edges_color = (
+                _subset(v, inside) for v in (edges_width, edges_color))
+            labels = [labels[i] for i in members]
+            src, dst = index[src[inside]], index[dst[inside]]
     if ax is None:
         ax = plt.gca()
 
-    if layout == "bipartite_layout":
-        pos = getattr(nx.drawing.layout, layout
-                      ).__call__(G, [e[0] for e in edges])
+    if pos is None:
+        if layout_cache is not None:
+            coords = _cached_layout(labels, src, dst, layout, layout_kw,
+                                    layout_cache)
+        else:
+            coords = _compute_layout(labels, src, dst, layout, layout_kw)
     else:
-        pos = getattr(nx.drawing.layout, layout).__call__(G)
+        coords = np.array([pos[node] for node in labels],
+                          dtype=float).reshape(-1, 2)
 
     if nodes_size is not None:
-        node_size_norm = Normalize()
-        if nodes_size_range is not None:
-            vmin, vmax = nodes_size_range
-            node_size_norm.vmin = vmin
-            node_size_norm.vmax = vmax
-        else:
-            node_size_norm.autoscale(nodes_size)
+        node_size_norm = get_norm(nodes_size, nodes_size_range)
         nodes_size = node_size_norm(
             nodes_size) * (sizes[1] - sizes[0]) + sizes[0]
     else:
         nodes_size = sizes[0]
 
     if edges_width is not None:
-
-        if edges_width_range is not None:
-            vmin, vmax = edges_width_range
-            edges_width_norm = Normalize(vmin=vmin, vmax=vmax)
-        else:
-            edges_width_norm = Normalize()
-            edges_width_norm.autoscale(edges_width)
+        edges_width_norm = get_norm(edges_width, edges_width_range)
         edges_width = edges_width_norm(
             edges_width) * (linewidth[1] - linewidth[0]) + linewidth[0]
     else:
@@ -137,41 +452,56 @@ def graph(
     edge_cmin, edge_cmax = None, None
     if nodes_color is not None:
         if not isinstance(nodes_color, str):
-            if nodes_color_range is None:
-                node_cmin, node_cmax = (np.nanmin(nodes_color),
-                                        np.nanmax(nodes_color))
-            else:
-                node_cmin, node_cmax = nodes_color_range
+            norm = get_norm(nodes_color, nodes_color_range)
+            node_cmin, node_cmax = norm.vmin, norm.vmax
 
     if edges_color is not None:
         if not isinstance(edges_color, str):
-            if edges_color_range is None:
-                edge_cmin, edge_cmax = (np.nanmin(edges_color),
-                                        np.nanmax(edges_color))
-            else:
-                edge_cmin, edge_cmax = edges_color_range
-    nodes_patches = nx.draw_networkx_nodes(G, pos,
-                                           node_size=nodes_size,
-                                           node_color=nodes_color,
-                                           node_shape=node_shape,
-                                           vmin=node_cmin,
-                                           vmax=node_cmax,
-                                           cmap=get_colormap(node_cmap),
-                                           linewidths=0,
-                                           )
-    edges_patches = nx.draw_networkx_edges(G, pos,
-                                           width=edges_width,
-                                           edge_color=edges_color,
-                                           edge_vmin=edge_cmin,
-                                           edge_vmax=edge_cmax,
-                                           edge_cmap=get_colormap(edge_cmap),
-                                           arrowstyle=arrowstyle,
-                                           connectionstyle=connectionstyle,
-                                           )
+            norm = get_norm(edges_color, edges_color_range)
+            edge_cmin, edge_cmax = norm.vmin, norm.vmax
+    if node_cmin is not None:
+        node_color_options = dict(c=nodes_color, vmin=node_cmin,
+                                  vmax=node_cmax, cmap=get_colormap(node_cmap))
+    else:
+        node_color_options = dict(c=nodes_color)
+    nodes_patches = ax.scatter(coords[:, 0], coords[:, 1],
+                               s=nodes_size,
+                               marker=node_shape,
+                               linewidths=0,
+                               zorder=2,
+                               **node_color_options)
+    target_size = np.broadcast_to(nodes_size, (len(labels),))[dst]
+    edges_patches = _draw_edges(ax, coords[src], coords[dst],
+                                width=edges_width,
+                                color=edges_color,
+                                cmap=get_colormap(edge_cmap),
+                                vmin=edge_cmin,
+                                vmax=edge_cmax,
+                                connectionstyle=connectionstyle,
+                                arrowstyle=arrowstyle,
+                                target_size=target_size,
+                                )
     label_options = {"ec": "k", "fc": "white", "alpha": 0.7}
-    nx.draw_networkx_labels(G, pos,
-                            font_size=mpl.rcParams['font.size'],
-                            bbox=label_options)
+    label_kw = dict(ha="center", va="center", clip_on=True,
+                    fontsize=mpl.rcParams['font.size'], bbox=label_options)
+    if label_priority is None:
+        for label, (x, y) in zip(labels, coords):
+            ax.text(x, y, str(label), **label_kw)
+    else:
+        if isinstance(label_priority, str):
+            if label_priority == "size":
+                priority = np.broadcast_to(nodes_size, (len(labels),))
+            elif label_priority == "degree":
+                priority = np.bincount(src, minlength=len(labels)) + \
+                    np.bincount(dst, minlength=len(labels))
+            else:
+                raise ValueError(f"label_priority must be 'size', 'degree' "
+                                 f"or an array, got '{label_priority}'")
+        else:
+            priority = label_priority
+        ax.add_artist(CulledLabels(coords, labels, priority, **label_kw))
+    ax.tick_params(axis="both", which="both", bottom=False, left=False,
+                   labelbottom=False, labelleft=False)
 
     if node_cmin is not None:
         node_cbar_options = dict(
@@ -187,4 +517,6 @@ def graph(
         edge_cbar_options = {**edge_cbar_options, **edge_cbar_kw}
         Colorbar(edges_patches, ax=ax, **edge_cbar_options)
     despine(ax=ax, left=True, bottom=True)
+    if return_pos:
+        return ax, dict(zip(labels, coords))
     return ax
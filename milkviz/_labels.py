@@ -0,0 +1,188 @@
+"""Text labels that don't overlap, culled in display space"""
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+
+import matplotlib as mpl
+import numpy as np
+from matplotlib.artist import Artist
+from matplotlib.text import Text
+
+
+def text_extent(texts, fontsize, dpi, pad=0.8):
+    """Estimate the width of each text and the height in pixels
+
+    The width is approximated from the number of characters,
+    no text is laid out.
+    """
+    chars = np.array([len(t) for t in texts], dtype=float)
+    px = fontsize * dpi / 72
+    return (0.65 * chars + pad) * px, (1.2 + pad) * px
+
+
+def select_labels(xy, widths, height, priority, bounds):
+    """Greedy selection of the labels that don't overlap
+
+    Parameters
+    ----------
+    xy : np.ndarray
+        The (n, 2) centers of labels in display space
+    widths : np.ndarray
+        The width of each label in pixels
+    height : float
+        The height of labels in pixels
+    priority : np.ndarray
+        Labels of higher priority are placed first
+    bounds : tuple
+        (x0, y0, x1, y1), the labels outside are skipped
+
+    Returns
+    -------
+    np.ndarray
+        The index of the selected labels
+
+    """
+    x0, y0, x1, y1 = bounds
+    ix = np.flatnonzero((xy[:, 0] >= x0) & (xy[:, 0] <= x1) &
+                        (xy[:, 1] >= y0) & (xy[:, 1] <= y1))
+    if len(ix) == 0:
+        return ix
+    ix = ix[np.argsort(-priority[ix], kind="stable")]
+
+    # two labels in a cell of the narrowest label always overlap,
+    # only the first one of each cell is a candidate
+    min_w = max(widths[ix].min(), 1)
+    cell = np.floor(xy[ix] / [min_w, height]).astype(np.int64)
+    _, first = np.unique(cell, axis=0, return_index=True)
+    ix = ix[np.sort(first)]
+
+    # check the candidates against the placed labels in the
+    # neighboring cells of the widest label
+    max_w = widths[ix].max()
+    grid = {}
+    selected = []
+    for i in ix:
+        x, y = xy[i]
+        cx, cy = int(x // max_w), int(y // height)
+        overlap = False
+        for key in ((cx + a, cy + b) for a in (-1, 0, 1) for b in (-1, 0, 1)):
+            for j in grid.get(key, ()):
+                if abs(xy[j, 0] - x) < (widths[i] + widths[j]) / 2 and \
+                        abs(xy[j, 1] - y) < height:
+                    overlap = True
+                    break
+            if overlap:
+                break
+        if not overlap:
+            grid.setdefault((cx, cy), []).append(i)
+            selected.append(i)
+    return np.array(selected, dtype=np.intp)
+
+
+class _ViewLabels(Artist, ABC):
+    """Text labels in data coordinates, selected for the current view
+
+    The selection runs at draw time, after the layout is done,
+    so it follows zooming, panning, resizing and the dpi of the output.
+    Only the selected labels are turned into :class:`matplotlib.text.Text`.
+    """
+    zorder = 3
+
+    def __init__(self, xy, texts, **text_kw):
+        super().__init__()
+        self.xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        self.texts = [str(t) for t in texts]
+        self.text_kw = text_kw
+        self.fontsize = text_kw.get("fontsize", mpl.rcParams["font.size"])
+        self._artists = {}
+
+    @abstractmethod
+    def _select(self):
+        """The index of labels to draw"""
+
+    def _text(self, i):
+        if i not in self._artists:
+            text = Text(*self.xy[i], self.texts[i], **self.text_kw)
+            text.set_figure(self.figure)
+            text.axes = self.axes
+            text.set_transform(self.axes.transData)
+            if text.get_clip_on():
+                text.set_clip_path(self.axes.patch)
+            self._artists[i] = text
+        return self._artists[i]
+
+    def get_texts(self):
+        """The labels drawn in the last draw"""
+        return [self._artists[i] for i in getattr(self, "_drawn", [])]
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        self._drawn = self._select()
+        for i in self._drawn:
+            self._text(i).draw(renderer)
+        self.stale = False
+
+
+class CulledLabels(_ViewLabels):
+    """Labels that are drawn only where they don't overlap
+
+    Parameters
+    ----------
+    xy : array-like
+        The (n, 2) positions of labels in data coordinates
+    texts : list of str
+    priority : array-like
+        Labels of higher priority are placed first
+    **text_kw :
+        Pass to :class:`matplotlib.text.Text`
+
+    """
+
+    def __init__(self, xy, texts, priority, **text_kw):
+        super().__init__(xy, texts, **text_kw)
+        self.priority = np.asarray(priority, dtype=float)
+
+    def _select(self):
+        widths, height = text_extent(self.texts, self.fontsize,
+                                     self.figure.dpi)
+        xy = self.axes.transData.transform(self.xy)
+        return select_labels(xy, widths, height, self.priority,
+                             self.axes.bbox.extents)
+
+
+class FittedLabels(_ViewLabels):
+    """Labels that are drawn only when they fit in their box
+
+    Parameters
+    ----------
+    xy : array-like
+        The (n, 2) centers of boxes in data coordinates
+    texts : list of str
+    extents : array-like
+        The (n, 2) width and height of boxes in data coordinates
+    **text_kw :
+        Pass to :class:`matplotlib.text.Text`, a rotation of
+        90 or -90 swaps the width and height of the text
+
+    """
+
+    def __init__(self, xy, texts, extents, **text_kw):
+        super().__init__(xy, texts, **text_kw)
+        self.extents = np.asarray(extents, dtype=float).reshape(-1, 2)
+
+    def _select(self):
+        trans = self.axes.transData
+        size = np.abs(trans.transform(self.xy + self.extents / 2)
+                      - trans.transform(self.xy - self.extents / 2))
+        widths, height = text_extent(self.texts, self.fontsize,
+                                     self.figure.dpi)
+        heights = np.full(len(widths), height)
+        if abs(self.text_kw.get("rotation", 0)) == 90:
+            widths, heights = heights, widths
+        x0, y0, x1, y1 = self.axes.bbox.extents
+        xy = trans.transform(self.xy)
+        fit = (widths <= size[:, 0]) & (heights <= size[:, 1]) & \
+            (xy[:, 0] >= x0) & (xy[:, 0] <= x1) & \
+            (xy[:, 1] >= y0) & (xy[:, 1] <= y1)
+        return np.flatnonzero(fit)
@@ -0,0 +1,424 @@
+"""Vectorized force-directed layout for large graphs"""
+from __future__ import annotations
+
+import hashlib
+
+import numpy as np
+
+# Below this number of nodes, repulsion is computed between all pairs
+EXACT_SIZE = 1000
+# The number of pairwise entries computed in one block
+BLOCK_ENTRIES = 2 ** 22
+# Stop coarsening when the graph is this small
+COARSEST_SIZE = 50
+# Nodes further than this times the median radius are pulled back
+OUTLIER_RADIUS = 3
+# A fine cell with more nodes is split again on its own grid
+CELL_CAPACITY = 256
+# Beyond this depth of splits, a crowded cell acts as a single node
+MAX_SPLITS = 4
+
+
+def _repulsion_exact(pos, mass):
+    """The repulsive displacement between all pairs of nodes"""
+    n = len(pos)
+    disp = np.zeros_like(pos)
+    chunk_size = max(1, BLOCK_ENTRIES // n)
+    for start in range(0, n, chunk_size):
+        delta = pos[start:start + chunk_size, np.newaxis, :] \
+            - pos[np.newaxis, :, :]
+        d2 = np.einsum("ijk,ijk->ij", delta, delta)
+        # the node itself has zero distance and no contribution
+        d2[d2 == 0] = np.inf
+        disp[start:start + chunk_size] = np.einsum(
+            "ij,ijk->ik", mass[np.newaxis, :] / d2, delta)
+    return disp
+
+
+def _cell_centers(cell, pos, mass, n_cells):
+    """The total mass and the center of mass in each cell"""
+    cell_mass = np.bincount(cell, mass, minlength=n_cells)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cell_pos = np.column_stack([
+            np.bincount(cell, mass * pos[:, i], minlength=n_cells)
+            for i in range(2)
+        ]) / cell_mass[:, np.newaxis]
+    return cell_mass, np.nan_to_num(cell_pos)
+
+
+def _far_displacement(pos, targets, weight):
+    """Repulsion from weighted targets, weight is (n, targets) or (targets,)
+
+    targets can be (t, 2) shared by all nodes or (n, t, 2) per node.
+    """
+    n = len(pos)
+    disp = np.zeros_like(pos)
+    chunk_size = max(1, BLOCK_ENTRIES // targets.shape[-2])
+    for start in range(0, n, chunk_size):
+        stop = start + chunk_size
+        t = targets if targets.ndim == 2 else targets[start:stop]
+        w = weight if weight.ndim == 1 else weight[start:stop]
+        delta = pos[start:stop, np.newaxis, :] - t
+        d2 = np.einsum("ijk,ijk->ij", delta, delta)
+        d2[d2 == 0] = np.inf
+        disp[start:stop] = np.einsum("ij,ijk->ik", w / d2, delta)
+    return disp
+
+
+def _grid_size(n):
+    """The number of coarse cells on each side of the grid for n nodes"""
+    return int(np.clip(np.sqrt(n) / 16, 4, 32))
+
+
+def _repulsion_grid(pos, mass, grid_size, depth=0):
+    """The repulsive displacement approximated on two nested grids
+
+    Nodes in the same fine cell repel each other exactly, the fine cells
+    around a node act as single nodes at their center of mass,
+    beyond that, the coarse cells act as single nodes.
+    A fine cell with more than `CELL_CAPACITY` nodes, like the one
+    holding most nodes when many outliers stretch the grid,
+    is split again on a grid over its own nodes.
+    """
+    n = len(pos)
+    split = 4
+    fine_size = grid_size * split
+    # a few far away nodes should not squeeze the others into one cell,
+    # they are clipped into the border cells instead
+    lo, hi = np.quantile(pos, [0.005, 0.995], axis=0)
+    cell_size = (hi - lo).max() / fine_size + 1e-12
+    fine_xy = np.clip(((pos - lo) / cell_size).astype(np.intp),
+                      0, fine_size - 1)
+    coarse_xy = fine_xy // split
+    fine = fine_xy[:, 0] * fine_size + fine_xy[:, 1]
+    coarse = coarse_xy[:, 0] * grid_size + coarse_xy[:, 1]
+    fine_mass, fine_pos = _cell_centers(fine, pos, mass, fine_size ** 2)
+    coarse_mass, coarse_pos = _cell_centers(coarse, pos, mass,
+                                            grid_size ** 2)
+
+    # far field, coarse cells out of the 3x3 coarse neighborhood
+    cx, cy = np.divmod(np.arange(grid_size ** 2), grid_size)
+    disp = np.zeros_like(pos)
+    chunk_size = max(1, BLOCK_ENTRIES // grid_size ** 2)
+    for start in range(0, n, chunk_size):
+        stop = start + chunk_size
+        xy = coarse_xy[start:stop]
+        near = (np.abs(xy[:, 0, np.newaxis] - cx) <= 1) & \
+            (np.abs(xy[:, 1, np.newaxis] - cy) <= 1)
+        weight = np.where(near, 0, coarse_mass)
+        disp[start:stop] = _far_displacement(pos[start:stop], coarse_pos,
+                                             weight)
+
+    # middle field, fine cells in the 3x3 coarse neighborhood
+    offset = np.arange(-split, 2 * split)
+    for start in range(0, n, chunk_size):
+        stop = start + chunk_size
+        nx = coarse_xy[start:stop, 0, np.newaxis] * split + offset
+        ny = coarse_xy[start:stop, 1, np.newaxis] * split + offset
+        valid = ((nx >= 0) & (nx < fine_size))[:, :, np.newaxis] & \
+            ((ny >= 0) & (ny < fine_size))[:, np.newaxis, :]
+        ix = np.clip(nx, 0, fine_size - 1)[:, :, np.newaxis] * fine_size \
+            + np.clip(ny, 0, fine_size - 1)[:, np.newaxis, :]
+        ix = ix.reshape(len(ix), -1)
+        weight = np.where(valid.reshape(len(ix), -1)
+                          & (ix != fine[start:stop, np.newaxis]),
+                          fine_mass[ix], 0)
+        disp[start:stop] += _far_displacement(pos[start:stop], fine_pos[ix],
+                                              weight)
+
+    # near field, all pairs in the same fine cell
+    order = np.argsort(fine, kind="stable")
+    counts = np.bincount(fine, minlength=fine_size ** 2)
+    starts = np.cumsum(counts) - counts
+    crowded = counts > CELL_CAPACITY
+    for cell in np.flatnonzero(crowded):
+        if depth == MAX_SPLITS:
+            break
+        ix = order[starts[cell]:starts[cell] + counts[cell]]
+        disp[ix] += _repulsion_grid(pos[ix], mass[ix], _grid_size(len(ix)),
+                                    depth + 1)
+    group_size = np.where(crowded, 0, counts)[fine[order]]
+    rows = np.repeat(order, group_size)
+    member = np.arange(len(rows)) - np.repeat(
+        np.cumsum(group_size) - group_size, group_size)
+    cols = order[np.repeat(starts[fine[order]], group_size) + member]
+    keep = rows != cols
+    rows, cols = rows[keep], cols[keep]
+    delta = pos[rows] - pos[cols]
+    d2 = np.einsum("ij,ij->i", delta, delta)
+    d2[d2 == 0] = np.inf
+    force = delta * (mass[cols] / d2)[:, np.newaxis]
+    for axis in range(2):
+        disp[:, axis] += np.bincount(rows, force[:, axis], minlength=n)
+    return disp
+
+
+def _attraction(pos, src, dst, weight):
+    """The attractive displacement along edges, d^2 / k with k = 1"""
+    n = len(pos)
+    delta = pos[src] - pos[dst]
+    dist = np.sqrt(np.einsum("ij,ij->i", delta, delta))
+    force = delta * (weight * dist)[:, np.newaxis]
+    disp = np.zeros_like(pos)
+    for axis in range(2):
+        disp[:, axis] = np.bincount(dst, force[:, axis], minlength=n) \
+            - np.bincount(src, force[:, axis], minlength=n)
+    return disp
+
+
+def _fr_iterations(pos, src, dst, weight, mass, iterations, temperature):
+    """Run Fruchterman-Reingold iterations in the unit of k = 1"""
+    n = len(pos)
+    if n < 2:
+        return pos
+    grid_size = _grid_size(n)
+    for t in np.linspace(temperature, temperature / iterations, iterations):
+        if n <= EXACT_SIZE:
+            disp = _repulsion_exact(pos, mass)
+        else:
+            disp = _repulsion_grid(pos, mass, grid_size)
+        disp += _attraction(pos, src, dst, weight)
+        length = np.sqrt(np.einsum("ij,ij->i", disp, disp))
+        length[length == 0] = 1
+        pos += disp * (np.minimum(length, t) / length)[:, np.newaxis]
+    return pos
+
+
+def _merge_edges(src, dst, weight, n):
+    """Drop self loops and sum the weights of duplicated edges"""
+    keep = src != dst
+    src, dst, weight = src[keep], dst[keep], weight[keep]
+    lo, hi = np.minimum(src, dst), np.maximum(src, dst)
+    key, inverse = np.unique(lo * n + hi, return_inverse=True)
+    weight = np.bincount(inverse, weight, minlength=len(key))
+    return key // n, key % n, weight
+
+
+def _coarsen(n, src, dst, weight, mass, rng, rounds=5):
+    """Collapse matched pairs of nodes
+
+    In each round, every unmatched node proposes the unmatched neighbor
+    on its heaviest edge, normalized by the mass of the two ends to keep
+    the coarse nodes balanced (ties are broken randomly), mutual
+    proposals are matched and merged into one node.
+
+    Returns
+    -------
+    The number of coarse nodes and the coarse id of each node
+
+    """
+    heads = np.concatenate([src, dst])
+    tails = np.concatenate([dst, src])
+    key = np.tile(weight / (mass[src] * mass[dst]), 2)
+    ix = np.arange(n)
+    mate = np.full(n, -1)
+    for _ in range(rounds):
+        free = (mate[heads] < 0) & (mate[tails] < 0)
+        if not free.any():
+            break
+        h, t = heads[free], tails[free]
+        k = key[free] * (1 + rng.random(len(h)))
+        order = np.lexsort((-k, h))
+        proposer, first = np.unique(h[order], return_index=True)
+        best = np.full(n, -1)
+        best[proposer] = t[order][first]
+        matched = (best >= 0) & (best[np.maximum(best, 0)] == ix)
+        mate[matched] = best[matched]
+
+    parent = np.where((mate >= 0) & (mate < ix), mate, ix)
+    uni, parent = np.unique(parent, return_inverse=True)
+    return len(uni), parent
+
+
+def fast_fr_layout(n, src, dst, weight=None, pos=None, iterations=50,
+                   multilevel=True, seed=None):
+    """Fruchterman-Reingold layout for large graphs
+
+    The repulsion is approximated on a grid when the graph has more than
+    1000 nodes, and the graph is coarsened by edge matching, laid out
+    from the coarsest level, and refined level by level.
+
+    Parameters
+    ----------
+    n : int
+        The number of nodes
+    src, dst : array-like of int
+        The index of nodes on the two ends of edges
+    weight : array-like
+        The weight of edges, default to 1
+    pos : array-like
+        The (n, 2) initial positions to warm-start from,
+        NaN for the nodes without position. When given, no coarsening
+        is done and the result is in the same coordinates as `pos`
+    iterations : int, default: 50
+        The number of iterations at each level, levels with more than
+        1000 nodes are refined with a fifth of it
+    multilevel : bool, default: True
+        Whether to coarsen the graph for a cold start
+    seed : int
+        The random seed
+
+    Returns
+    -------
+    np.ndarray
+        The (n, 2) positions, rescaled into [-1, 1]
+        if no initial positions are given
+
+    """
+    rng = np.random.default_rng(seed)
+    src = np.asarray(src, dtype=np.intp)
+    dst = np.asarray(dst, dtype=np.intp)
+    weight = np.ones(len(src)) if weight is None \
+        else np.asarray(weight, dtype=float)
+    src, dst, weight = _merge_edges(src, dst, weight, n)
+
+    if pos is not None:
+        return _warm_layout(n, src, dst, weight, np.asarray(pos, dtype=float),
+                            iterations, rng)
+
+    # coarsen the graph until it is small or can't be reduced,
+    # the summed weights of coarse edges are only used for matching
+    levels = [(n, src, dst, weight, np.ones(n), None)]
+    while multilevel and levels[-1][0] > COARSEST_SIZE:
+        level_n, level_src, level_dst, level_w, level_mass, _ = levels[-1]
+        coarse_n, parent = _coarsen(level_n, level_src, level_dst, level_w,
+                                    level_mass, rng)
+        if coarse_n > 0.9 * level_n:
+            break
+        coarse_src, coarse_dst, coarse_w = _merge_edges(
+            parent[level_src], parent[level_dst], level_w, coarse_n)
+        coarse_mass = np.bincount(parent, level_mass, minlength=coarse_n)
+        levels[-1] = levels[-1][:-1] + (parent,)
+        levels.append((coarse_n, coarse_src, coarse_dst, coarse_w,
+                       coarse_mass, None))
+
+    def run(level, layout, rounds, temperature):
+        level_n, level_src, level_dst, level_w, _, _ = levels[level]
+        if level > 0:
+            level_w = np.ones(len(level_src))
+        return _fr_iterations(layout, level_src, level_dst, level_w,
+                              np.ones(level_n), rounds, temperature)
+
+    coarse_n = levels[-1][0]
+    layout = rng.random((coarse_n, 2)) * np.sqrt(coarse_n)
+    layout = run(len(levels) - 1, layout, iterations, np.sqrt(coarse_n) / 2)
+    for level in range(len(levels) - 2, -1, -1):
+        # the children start around the parent, the area grows with
+        # the number of nodes as k = 1 at every level
+        level_n, parent = levels[level][0], levels[level][-1]
+        scale = np.sqrt(level_n / len(layout))
+        layout = layout[parent] * scale \
+            + rng.normal(scale=0.1, size=(level_n, 2))
+        # small levels are cheap, give them time to unfold
+        rounds = iterations if level_n <= EXACT_SIZE \
+            else max(5, iterations // 5)
+        layout = run(level, layout, rounds, 2.0)
+    return _rescale(layout)
+
+
+def _warm_layout(n, src, dst, weight, pos, iterations, rng):
+    """Continue the layout from known positions"""
+    pos = pos.copy()
+    known = ~np.isnan(pos).any(axis=1)
+    if not known.any():
+        return fast_fr_layout(n, src, dst, weight, iterations=iterations,
+                              seed=rng)
+    # work in the unit of k = 1, estimated from the known positions
+    lo = pos[known].min(axis=0)
+    span = np.maximum(pos[known].max(axis=0) - lo, 1e-12)
+    k = np.sqrt(span[0] * span[1] / known.sum()) \
+        if known.sum() > 1 else 1.0
+    layout = (pos - lo) / k
+
+    # place the new nodes at the center of their known neighbors
+    unknown = np.flatnonzero(~known)
+    if len(unknown):
+        heads = np.concatenate([src, dst])
+        tails = np.concatenate([dst, src])
+        useful = (~known[heads]) & known[tails]
+        count = np.bincount(heads[useful], minlength=n)
+        center = np.column_stack([
+            np.bincount(heads[useful], layout[tails[useful], i], minlength=n)
+            for i in range(2)
+        ])
+        has_neighbor = count[unknown] > 0
+        fallback = rng.random((len(unknown), 2)) * (span / k)
+        layout[unknown] = np.where(
+            has_neighbor[:, np.newaxis],
+            center[unknown] / np.maximum(count[unknown], 1)[:, np.newaxis],
+            fallback,
+        ) + rng.normal(scale=0.1, size=(len(unknown), 2))
+
+    layout = _fr_iterations(layout, src, dst, weight, np.ones(n),
+                            iterations, 1.0) * k + lo
+    # the layout may drift, grow or shrink as a whole, align it back to
+    # the known positions by the least squares scale and translation
+    before, after = pos[known], layout[known]
+    center_before, center_after = before.mean(axis=0), after.mean(axis=0)
+    spread = ((after - center_after) ** 2).sum()
+    scale = ((after - center_after) * (before - center_before)).sum() \
+        / spread if spread > 0 else 1.0
+    return _pull_outliers((layout - center_after) * scale + center_before)
+
+
+def _pull_outliers(pos):
+    """Pull the few nodes pushed far away from the rest, like the isolated
+    nodes, onto a ring around the others"""
+    center = np.median(pos, axis=0)
+    pos = pos - center
+    radius = np.sqrt(np.einsum("ij,ij->i", pos, pos))
+    if len(pos) > 1:
+        limit = OUTLIER_RADIUS * np.median(radius)
+        far = radius > limit
+        pos[far] *= (limit / radius[far])[:, np.newaxis]
+    return pos + center
+
+
+def _rescale(pos):
+    """Center the positions and scale them into [-1, 1]"""
+    pos = _pull_outliers(pos)
+    pos = pos - np.median(pos, axis=0)
+    scale = np.abs(pos).max()
+    return pos / scale if scale > 0 else pos
+
+
+def layout_key(nodes, src, dst, layout, params):
+    """A canonical hash of a graph and its layout settings
+
+    The hash does not depend on the order of nodes or edges,
+    or the direction of edges.
+
+    Parameters
+    ----------
+    nodes : array-like
+        The nodes
+    src, dst : array-like of int
+        The index of nodes on the two ends of edges
+    layout : str
+        The name of layout
+    params : dict
+        The parameters of layout
+
+    Returns
+    -------
+    key : str
+        The hex digest
+    order : np.ndarray
+        The canonical order of nodes, positions should be stored
+        in this order
+
+    """
+    labels = np.array([repr(node) for node in nodes], dtype=object)
+    order = np.argsort(labels, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    src, dst = rank[np.asarray(src)], rank[np.asarray(dst)]
+    pairs = np.unique(np.minimum(src, dst) * len(order)
+                      + np.maximum(src, dst))
+
+    h = hashlib.sha1()
+    h.update("\0".join(labels[order]).encode())
+    h.update(pairs.astype(np.int64).tobytes())
+    h.update(layout.encode())
+    h.update(repr(sorted(params.items())).encode())
+    return h.hexdigest(), order
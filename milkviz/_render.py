@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import inspect
+import threading
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# The figures and canvases of each thread, by (figsize, dpi)
+_canvases = threading.local()
+
+
+def _canvas(figsize, dpi):
+    """A cleared figure on an Agg canvas, reused for the same size"""
+    cache = getattr(_canvases, "cache", None)
+    if cache is None:
+        cache = _canvases.cache = {}
+    key = (tuple(figsize), dpi)
+    if key not in cache:
+        fig = Figure(figsize=figsize, dpi=dpi)
+        cache[key] = FigureCanvasAgg(fig)
+    canvas = cache[key]
+    canvas.figure.clear()
+    return canvas
+
+
+def _draw_plot(plot, fig):
+    """Call plot with the axes or the figure to draw on"""
+    try:
+        params = inspect.signature(plot).parameters
+    except (TypeError, ValueError):
+        params = {}
+    if "ax" in params:
+        plot(ax=fig.add_subplot())
+    elif "figure" in params:
+        plot(figure=fig)
+    else:
+        plot(fig)
+
+
+def render_rgba(plot, figsize=None, dpi=None, copy=False,
+                as_memoryview=False, out=None):
+    """Render a plot to RGBA pixels in memory, without encoding an image
+
+    Parameters
+    ----------
+    plot : Figure or callable
+        A figure, or a function that draws the plot. The function
+        is called with `ax` or `figure` if it has such a parameter,
+        like ``functools.partial(mv.bubble, x=x, y=y, size=size)``,
+        or with the figure otherwise.
+    figsize : (float, float)
+        The size in inches, default to the size of the figure,
+        or the matplotlib default for a function
+    dpi : float
+        Default to the dpi of the figure, or the matplotlib default
+    copy : bool, default: False
+        By default, the array is a view of the canvas, the canvas
+        is reused when rendering a function at the same size and dpi
+        in the same thread, the pixels are overwritten by the next call.
+        Set to True to get a copy.
+    as_memoryview : bool, default: False
+        Return the memoryview of the canvas buffer instead of an array
+    out : writable buffer
+        Copy the pixels into it, like the ``buf`` of a
+        :class:`multiprocessing.shared_memory.SharedMemory`,
+        it's returned as an array of the shape of the image
+
+    Returns
+    -------
+    np.ndarray of uint8, of shape (height, width, 4)
+
+    """
+    if isinstance(plot, Figure):
+        fig = plot
+        old_canvas = fig.canvas
+        old_size, old_dpi = fig.get_size_inches(), fig.dpi
+        # an Agg canvas keeps its renderer between calls
+        canvas = old_canvas if isinstance(old_canvas, FigureCanvasAgg) \
+            else FigureCanvasAgg(fig)
+        try:
+            if figsize is not None:
+                fig.set_size_inches(figsize, forward=False)
+            if dpi is not None:
+                fig.set_dpi(dpi)
+            canvas.draw()
+        finally:
+            fig.set_size_inches(old_size, forward=False)
+            fig.set_dpi(old_dpi)
+            fig.set_canvas(old_canvas)
+    else:
+        default = Figure()
+        figsize = default.get_size_inches() if figsize is None else figsize
+        dpi = default.dpi if dpi is None else dpi
+        canvas = _canvas(figsize, dpi)
+        _draw_plot(plot, canvas.figure)
+        canvas.draw()
+
+    buffer = canvas.buffer_rgba()
+    if as_memoryview:
+        return buffer
+    pixels = np.asarray(buffer)
+    if out is not None:
+        target = np.frombuffer(out, dtype=np.uint8,
+                               count=pixels.size).reshape(pixels.shape)
+        target[...] = pixels
+        return target
+    return pixels.copy() if copy else pixels
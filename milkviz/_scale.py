@@ -0,0 +1,209 @@
+"""One-pass statistics to build the norms and legends of plots"""
+from __future__ import annotations
+
+import numpy as np
+from matplotlib.colors import Normalize
+
+
+def _finite(values):
+    """The non-NaN values as a flat float array, masked values are dropped"""
+    values = np.ma.filled(np.ma.asarray(values, dtype=float), np.nan).ravel()
+    return values[~np.isnan(values)]
+
+
+class QuantileSketch:
+    """A mergeable quantile sketch
+
+    The items are kept in levels of compactors (Karnin, Lang and Liberty,
+    2016), an item at level h stands for 2^h items. A full level is sorted
+    and every other item is promoted to the next level. The memory is
+    about 3k items, the rank error is about 2 / k.
+
+    Parameters
+    ----------
+    k : int
+        The capacity of the top level
+    seed : int
+
+    """
+
+    def __init__(self, k=400, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item stays, a random one of each pair is promoted
+                odd = len(items) % 2
+                offset = odd + self._rng.integers(2)
+                self.levels[level] = items[:odd]
+                self.levels[level + 1] = np.concatenate(
+                    [self.levels[level + 1], items[offset::2]])
+            level += 1
+
+    def update(self, values):
+        """Add an array of values"""
+        self.levels[0] = np.concatenate([self.levels[0], _finite(values)])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Add all the values seen by another sketch"""
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """The approximate quantiles, q in [0, 1]"""
+        items = np.concatenate(self.levels)
+        if len(items) == 0:
+            return np.full(np.shape(q), np.nan)
+        weights = np.concatenate([np.full(len(lv), 2. ** level)
+                                  for level, lv in enumerate(self.levels)])
+        order = np.argsort(items)
+        rank = np.cumsum(weights[order])
+        ix = np.searchsorted(rank, np.asarray(q) * rank[-1])
+        return items[order][np.minimum(ix, len(items) - 1)]
+
+
+class StreamingStats:
+    """The min, max, count, sum and quantiles of a stream of arrays
+
+    Build it over chunks of data with :meth:`update`, or merge the stats
+    built elsewhere with :meth:`merge`, then use :meth:`norm` to scale
+    the sizes or colors of a plot. Can be passed as the norm of a plot.
+
+    Parameters
+    ----------
+    k : int
+        The accuracy of quantiles, see :class:`QuantileSketch`
+    quantiles : bool, default: True
+        Whether to keep a quantile sketch. Without it, only the min, max,
+        count and sum are tracked in a single pass, enough for
+        :meth:`norm` without clipping
+
+    Examples
+    --------
+
+    >>> stats = StreamingStats()
+    >>> for chunk in chunks:
+    ...     stats.update(chunk["value"])
+    >>> norm = stats.norm(clip=(1, 99))
+
+    """
+
+    def __init__(self, k=400, quantiles=True):
+        self.count = 0
+        self.sum = 0.
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch(k) if quantiles else None
+
+    @classmethod
+    def from_chunks(cls, chunks, k=400, quantiles=True):
+        """Build the stats from an iterable of arrays"""
+        stats = cls(k, quantiles)
+        for chunk in chunks:
+            stats.update(chunk)
+        return stats
+
+    def update(self, values):
+        """Add an array of values, NaN and masked values are ignored"""
+        values = _finite(values)
+        if len(values):
+            self.count += len(values)
+            self.sum += values.sum()
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            if self.sketch is not None:
+                self.sketch.update(values)
+        return self
+
+    def merge(self, other):
+        """Add all the values seen by another stats"""
+        if self.sketch is not None and other.sketch is None:
+            raise ValueError("Cannot merge the stats without quantiles "
+                             "into the stats with quantiles")
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if self.sketch is not None:
+            self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else np.nan
+
+    def quantile(self, q):
+        """The approximate quantiles, the exact min and max at 0 and 1"""
+        q = np.asarray(q, dtype=float)
+        if self.sketch is None:
+            if np.any((q > 0) & (q < 1)):
+                raise ValueError("The quantiles are not tracked, "
+                                 "use StreamingStats(quantiles=True)")
+            result = np.full(q.shape, np.nan)
+        else:
+            result = np.asarray(self.sketch.quantile(q), dtype=float)
+        result = np.where(q <= 0, self.min, result)
+        return np.where(q >= 1, self.max, result)
+
+    def norm(self, clip=None):
+        """A :class:`matplotlib.colors.Normalize` of the values
+
+        Parameters
+        ----------
+        clip : (float, float)
+            The lower and upper percentiles, like (1, 99), the values
+            beyond are clipped to the ends
+
+        """
+        if self.count == 0:
+            return Normalize()
+        if clip is None:
+            return Normalize(vmin=self.min, vmax=self.max)
+        vmin, vmax = self.quantile(np.asarray(clip) / 100)
+        return Normalize(vmin=vmin, vmax=vmax, clip=True)
+
+    def legend_values(self, show_at=(.25, .5, .75, 1.)):
+        """The values to show in a size legend, at these quantiles"""
+        return self.quantile(show_at)
+
+
+def get_stats(values, quantiles=True):
+    """The stats of values, or the stats itself"""
+    if isinstance(values, StreamingStats):
+        return values
+    return StreamingStats(quantiles=quantiles).update(values)
+
+
+def get_norm(values, vrange=None):
+    """The norm of values
+
+    vrange can be a norm, a :class:`StreamingStats`,
+    or a (vmin, vmax) tuple, otherwise the min and max of values are used,
+    found in a single pass.
+    """
+    if isinstance(vrange, Normalize):
+        return vrange
+    if isinstance(vrange, StreamingStats):
+        return vrange.norm()
+    if vrange is not None:
+        vmin, vmax = vrange
+        return Normalize(vmin=vmin, vmax=vmax)
+    return get_stats(values, quantiles=False).norm()
@@ -0,0 +1,162 @@
+"""Cardinality sketches to estimate the overlap of huge sets"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+HASH_BITS = 64
+
+
+def _hash(values):
+    """The 64-bit hash of values, stable across processes"""
+    values = pd.Series(values, copy=False).to_numpy()
+    return pd.util.hash_array(values)
+
+
+def _bit_length(x):
+    """The number of bits of each uint64"""
+    x = x.copy()
+    n = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+
+def _bottom_k(hashes, k):
+    """The k smallest distinct hashes, sorted"""
+    if len(hashes) > 2 * k:
+        candidates = np.unique(np.partition(hashes, 2 * k)[:2 * k])
+        if len(candidates) >= k:
+            return candidates[:k]
+    return np.unique(hashes)[:k]
+
+
+class SetSketch:
+    """A mergeable sketch of a set, to draw the venn diagram of huge sets
+
+    The size of the set is estimated by HyperLogLog (Flajolet et al., 2007),
+    the overlap between sets by the k minimum values of hashes (KMV).
+    Sketches of the same set built in different processes or from
+    different files can be merged. Elements are hashed by their value
+    and type, 1 and "1" are different elements.
+
+    Parameters
+    ----------
+    p : int
+        HyperLogLog uses 2^p registers, the relative error
+        of the size is about 1.04 / sqrt(2^p)
+    k : int
+        The number of minimum hashes, the error of the fraction
+        of a region is about sqrt(f * (1 - f) / k)
+
+    Examples
+    --------
+
+    >>> sketch = SetSketch()
+    >>> for chunk in pd.read_csv("barcodes.csv", chunksize=1_000_000):
+    ...     sketch.update(chunk["barcode"])
+
+    """
+
+    def __init__(self, p=14, k=4096):
+        self.p = p
+        self.k = k
+        self.registers = np.zeros(2 ** p, dtype=np.uint8)
+        self.kmv = np.empty(0, dtype=np.uint64)
+
+    @classmethod
+    def from_chunks(cls, chunks, p=14, k=4096):
+        """Build the sketch from an iterable of arrays"""
+        sketch = cls(p, k)
+        for chunk in chunks:
+            sketch.update(chunk)
+        return sketch
+
+    def update(self, values):
+        """Add an array of elements"""
+        hashes = _hash(values)
+        if len(hashes) == 0:
+            return self
+        index = (hashes >> np.uint64(HASH_BITS - self.p)).astype(np.intp)
+        rest = hashes & np.uint64((1 << (HASH_BITS - self.p)) - 1)
+        rank = (HASH_BITS - self.p + 1 - _bit_length(rest)).astype(np.uint8)
+        # assign the ranks in increasing order, the max one is kept
+        for r in np.unique(rank):
+            hit = index[rank == r]
+            self.registers[hit] = np.maximum(self.registers[hit], r)
+
+        if len(self.kmv) == self.k:
+            hashes = hashes[hashes < self.kmv[-1]]
+        self.kmv = _bottom_k(np.concatenate([self.kmv, hashes]), self.k)
+        return self
+
+    def merge(self, other):
+        """Add all elements seen by another sketch of the same shape"""
+        if (self.p, self.k) != (other.p, other.k):
+            raise ValueError(f"Cannot merge a sketch with p={other.p}, "
+                             f"k={other.k} into p={self.p}, k={self.k}")
+        self.registers = np.maximum(self.registers, other.registers)
+        self.kmv = _bottom_k(np.concatenate([self.kmv, other.kmv]), self.k)
+        return self
+
+    def copy(self):
+        sketch = SetSketch(self.p, self.k)
+        return sketch.merge(self)
+
+    def __len__(self):
+        return int(round(self.count()))
+
+    def count(self):
+        """The estimated number of distinct elements"""
+        if len(self.kmv) < self.k:
+            # all distinct hashes are kept
+            return float(len(self.kmv))
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        harmonic = np.sum(2. ** -self.registers.astype(float))
+        estimate = alpha * m ** 2 / harmonic
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # linear counting for small sets
+            estimate = m * np.log(m / zeros)
+        return estimate
+
+    @property
+    def relative_error(self):
+        """The relative standard error of :meth:`count`"""
+        if len(self.kmv) < self.k:
+            return 0.
+        return 1.04 / np.sqrt(len(self.registers))
+
+
+def sketch_regions(sketches):
+    """Estimate the size of each region in the venn diagram of sketches
+
+    Returns
+    -------
+    sizes : np.ndarray
+        The size of regions in the order of the venn diagram,
+        (10, 01, 11) or (100, 010, 110, 001, 101, 011, 111)
+    errors : np.ndarray
+        The standard error of each size
+
+    """
+    union = sketches[0].copy()
+    for s in sketches[1:]:
+        union.merge(s)
+    n_union = union.count()
+    # the k minimum hashes of the union contain all hashes of each set
+    # below them, so the membership of these hashes is exact
+    mask = np.zeros(len(union.kmv), dtype=np.int64)
+    for i, s in enumerate(sketches):
+        mask |= np.isin(union.kmv, s.kmv).astype(np.int64) << i
+    n_regions = 2 ** len(sketches)
+    fraction = np.bincount(mask, minlength=n_regions)[1:] / \
+        max(len(union.kmv), 1)
+    sizes = fraction * n_union
+    kmv_error = 0. if len(union.kmv) < union.k else \
+        fraction * (1 - fraction) / union.k * n_union ** 2
+    errors = np.sqrt(kmv_error + (sizes * union.relative_error) ** 2)
+    return sizes, errors
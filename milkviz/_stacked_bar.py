@@ -3,14 +3,83 @@ from __future__ import annotations
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from itertools import tee
 from matplotlib.axes import Axes
-from matplotlib.collections import PatchCollection
-from matplotlib.patches import Rectangle
+from matplotlib.collections import PolyCollection
+from matplotlib.ticker import FixedLocator, FuncFormatter
 from natsort import natsorted
 from typing import Callable
 
-from .utils import set_default, cat_colors, set_cat_legend
+from ._labels import FittedLabels
+from .utils import set_default, cat_colors, set_cat_legend, other_colors
+
+# The maximum number of group labels on the axis
+MAX_TICKS = 100
+
+
+def _factorize(values, index):
+    """The codes of values in a growing index of labels"""
+    codes, uniques = pd.factorize(values)
+    lookup = np.array([index.setdefault(u, len(index)) for u in uniques],
+                      dtype=np.intp)
+    # NaN is coded as -1 and dropped
+    return np.where(codes >= 0, lookup[codes] if len(lookup) else -1, -1)
+
+
+def _aggregate(chunks, group, stacked, value=None):
+    """Sum the values of each (group, stacked) pair
+
+    The chunks are read one by one, the values are the number of rows
+    if value is None. Returns the group labels, the stacked labels,
+    the (groups x stacks) matrix, and whether the values are integral.
+    """
+    group_index, stacked_index = {}, {}
+    integral = value is None
+    matrix = np.zeros((0, 0), dtype=np.int64 if integral else np.float64)
+    for chunk in chunks:
+        g = _factorize(chunk[group], group_index)
+        s = _factorize(chunk[stacked], stacked_index)
+        if value is None:
+            weights = None
+        else:
+            weights = chunk[value].to_numpy()
+            integral = weights.dtype.kind in "iu"
+        valid = (g >= 0) & (s >= 0)
+        n_group, n_stacked = len(group_index), len(stacked_index)
+        counts = np.bincount(
+            g[valid] * n_stacked + s[valid],
+            None if weights is None else weights[valid],
+            minlength=n_group * n_stacked).reshape(n_group, n_stacked)
+        # the matrix grows with the new labels in this chunk
+        counts[:matrix.shape[0], :matrix.shape[1]] += matrix
+        matrix = counts
+    return list(group_index), list(stacked_index), matrix, integral
+
+
+def _reorder(matrix, labels, order, axis):
+    """Take the rows or columns of the labels in order, 0 if missing"""
+    ix = pd.Index(labels).get_indexer(order)
+    shape = list(matrix.shape)
+    shape[axis] = len(order)
+    result = np.zeros(shape, dtype=matrix.dtype)
+    taken = np.take(matrix, ix[ix >= 0], axis=axis)
+    if axis == 0:
+        result[ix >= 0] = taken
+    else:
+        result[:, ix >= 0] = taken
+    return result
+
+
+def _set_group_ticks(axis, group_order):
+    """Label the groups, at most MAX_TICKS of them are labeled evenly
+
+    A tick is only created for the labels shown.
+    """
+    labels = list(group_order)
+    axis.set_major_locator(
+        FixedLocator(np.arange(1, len(labels) + 1), nbins=MAX_TICKS))
+    axis.set_major_formatter(FuncFormatter(
+        lambda x, pos: labels[int(round(x)) - 1]
+        if 1 <= round(x) <= len(labels) else ""))
 
 
 def stacked_bar(data,
@@ -34,12 +103,16 @@ def stacked_bar(data,
 
     Parameters
     ----------
-    data : pd.DataFrame
-        The data used to plot
+    data : pd.DataFrame, iterable of pd.DataFrame
+        The data used to plot, or chunks of it, like the iterator from
+        :func:`pandas.read_csv` with `chunksize`, which are aggregated
+        one by one
     group : str
         The column used to group
     value : str
-        The column that contains numeric values for plotting
+        The column that contains numeric values for plotting.
+        If not provided, each row is a record and the number of
+        records are plotted
     stacked : str
         The column to plot as stack
     orient : "v" or "h"
@@ -56,11 +129,15 @@ def stacked_bar(data,
     show_values : bool
         Whether to display values of each block,
         or you can pass in a function to tell when to display
-        like `lambda x: x > 100` will only display when value exceed 100
+        like `lambda x: x > 100` will only display when value exceed 100.
+        A value is only displayed if it fits in its block,
+        this is checked again when the figure is redrawn
     props : dict
         Use to style text, pass to :func:`matplotlib.axes.Axes.text`
     legend_kw : dict
-        The options to configure legend
+        The options to configure legend, `max_items` limits the
+        number of stacks in the legend to the largest ones,
+        the others are grouped and colored as one
     ax :
 
     Returns
@@ -82,72 +159,82 @@ def stacked_bar(data,
     if ax is None:
         ax = plt.gca()
 
+    chunks = [data] if isinstance(data, pd.DataFrame) else data
+    group_labels, stacked_labels, matrix, integral = _aggregate(
+        chunks, group, stacked, value)
+
     if stacked_order is None:
-        stacked_order = natsorted(data[stacked].unique())
+        stacked_order = natsorted(stacked_labels)
     if group_order is None:
-        group_order = natsorted(data[group].unique())
+        group_order = natsorted(group_labels)
 
     _, legend_labels, legend_colors = \
         cat_colors(stacked_order, stacked_order, cmap, colors)
 
-    start_x = 1
-    gb = data.groupby([group], sort=False)
-    rects = []
-    lims = []
-
-    textprops = dict(ha="center", va="center",
-                     bbox=dict(fc="white", alpha=0.7))
-    textprops = {**textprops, **props}
-
-    mapping = {key: i for i, key in enumerate(stacked_order[::-1])}
-
-    for s in group_order:
-        df = gb.get_group(s).set_index(stacked)
-        slice_ix = sorted(df.index, key=lambda d: mapping[d])
-        df = df.loc[slice_ix]
-        text = df[value].to_numpy()
-        v_sum = np.sum(text)
-        vs = np.cumsum(text)
-        if percentage:
-            vs = vs / v_sum
-        lims.append(np.max(vs))
-        x = start_x - barwidth / 2
-        for v, c, t in zip(vs[::-1], legend_colors, text[::-1]):
-            if orient == "v":
-                rects.append(
-                    Rectangle(xy=(x, 0), width=barwidth, height=v,
-                              facecolor=c)
-                )
-                if show_values:
-                    ax.text(start_x, v, t, **textprops)
-            else:
-                rects.append(
-                    Rectangle(xy=(0, x), height=barwidth, width=v,
-                              facecolor=c)
-                )
-                if show_values:
-                    ax.text(v, start_x, t, rotation=-90, **textprops)
-
-        start_x += 1
-    patches = PatchCollection(rects, match_original=True)
-    ax.add_collection(patches)
-
-    value_label = "Percentage (%)" if percentage else value
+    # one (groups x stacks) matrix, the combinations that are not in the
+    # data or not in the orders are left as 0
+    matrix = _reorder(matrix, group_labels, group_order, axis=0)
+    matrix = _reorder(matrix, stacked_labels, stacked_order, axis=1)
+    n_group, n_stacked = matrix.shape
+
+    # the first of stacked_order is on the top
+    tops = np.cumsum(matrix[:, ::-1], axis=1)[:, ::-1]
+    if percentage:
+        totals = tops[:, :1]
+        tops = tops / np.where(totals == 0, 1, totals)
+    bottoms = np.concatenate([tops[:, 1:], np.zeros((n_group, 1))], axis=1)
+
+    gi, si = np.nonzero(matrix != 0)
+    x0 = gi + 1 - barwidth / 2
+    x1 = x0 + barwidth
+    y0, y1 = bottoms[gi, si], tops[gi, si]
+    if orient == "v":
+        verts = np.stack([np.column_stack([x0, y0]),
+                          np.column_stack([x0, y1]),
+                          np.column_stack([x1, y1]),
+                          np.column_stack([x1, y0])], axis=1)
+    else:
+        verts = np.stack([np.column_stack([y0, x0]),
+                          np.column_stack([y1, x0]),
+                          np.column_stack([y1, x1]),
+                          np.column_stack([y0, x1])], axis=1)
+    legend_colors = other_colors(legend_colors, matrix.sum(axis=0),
+                                 set_default(legend_kw, {}).get("max_items"))
+    face_colors = [legend_colors[i] for i in si]
+    ax.add_collection(PolyCollection(verts, facecolors=face_colors))
+    lims = tops.max(axis=1, initial=0)
+
+    if show_values:
+        textprops = dict(ha="center", va="center",
+                         bbox=dict(fc="white", alpha=0.7))
+        if orient != "v":
+            textprops["rotation"] = -90
+        textprops = {**textprops, **props}
+        texts = matrix[gi, si]
+        if integral:
+            texts = texts.astype(np.int64)
+        shown = np.array([bool(show_values_func(t)) for t in texts],
+                         dtype=bool)
+        # only the labels that fit in their segment are drawn
+        centers = np.column_stack([gi + 1, (y0 + y1) / 2])[shown]
+        extents = np.column_stack([np.full(len(gi), barwidth),
+                                   y1 - y0])[shown]
+        if orient != "v":
+            centers, extents = centers[:, ::-1], extents[:, ::-1]
+        ax.add_artist(FittedLabels(centers, texts[shown], extents,
+                                   **textprops))
+
+    value_label = "Percentage (%)" if percentage else \
+        set_default(value, "Count")
     if orient == "v":
         ax.set_xlim(0.5, len(group_order) + 0.5)
         ax.set_ylim(0, np.max(lims) * 1.05)
-        ax.xaxis.set_ticks(
-            ticks=np.arange(1, len(group_order)+1),
-            labels=group_order,
-        )
+        _set_group_ticks(ax.xaxis, group_order)
         ax.set(xlabel=group, ylabel=value_label)
     else:
         ax.set_ylim(0.5, len(group_order) + 0.5)
         ax.set_xlim(0, np.max(lims) * 1.05)
-        ax.yaxis.set_ticks(
-            ticks=np.arange(1, len(group_order) + 1),
-            labels=group_order,
-        )
+        _set_group_ticks(ax.yaxis, group_order)
         ax.set(xlabel=value_label, ylabel=group)
 
     set_cat_legend(
@@ -157,5 +244,6 @@ def stacked_bar(data,
         title=stacked,
         shape="square",
         legend_kw=legend_kw,
+        counts=matrix.sum(axis=0),
     )
     return ax
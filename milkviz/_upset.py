@@ -1,6 +1,162 @@
+from __future__ import annotations
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
 import matplotlib.pyplot as plt
 import numpy as np
-from upsetplot import UpSet
+import pandas as pd
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.ticker import MaxNLocator
+from typing import Mapping
+
+from ._labels import CulledLabels
+from ._sketch import _hash
+from .utils import set_default
+
+# The number of lines read from a file at once
+CHUNK_SIZE = 1_000_000
+
+
+def _membership(data):
+    """The membership of each distinct element as packed uint64 bitmasks
+
+    Returns an array of shape (elements, words), bit i of an element is
+    set if it's in the set i.
+    """
+    n_words = (len(data) - 1) // 64 + 1
+    arrays = [pd.Series(d, copy=False).to_numpy() for d in data]
+    # mixed types are compared as python objects
+    if len({a.dtype.kind for a in arrays}) > 1:
+        arrays = [a.astype(object) for a in arrays]
+    codes, uniques = pd.factorize(np.concatenate(arrays),
+                                  use_na_sentinel=False)
+    masks = np.zeros((len(uniques), n_words), dtype=np.uint64)
+    start = 0
+    for i, a in enumerate(arrays):
+        word, bit = divmod(i, 64)
+        masks[codes[start:start + len(a)], word] |= np.uint64(1) << \
+            np.uint64(bit)
+        start += len(a)
+    return masks
+
+
+def _histogram(masks):
+    """The distinct masks and the number of elements of each"""
+    if masks.shape[1] == 1:
+        subsets, sizes = np.unique(masks[:, 0], return_counts=True)
+        return subsets[:, np.newaxis], sizes
+    return np.unique(masks, axis=0, return_counts=True)
+
+
+def _merge_histograms(histograms):
+    """Sum the sizes of the same masks"""
+    subsets = np.concatenate([h[0] for h in histograms])
+    sizes = np.concatenate([h[1] for h in histograms])
+    subsets, inverse = np.unique(subsets, axis=0, return_inverse=True)
+    return subsets, np.bincount(inverse.ravel(), sizes).astype(np.int64)
+
+
+def _unpack(subsets, n_sets):
+    """The (subsets, sets) membership matrix of the masks"""
+    bits = np.unpackbits(subsets.astype("<u8").view(np.uint8), axis=1,
+                         bitorder="little")
+    return bits[:, :n_sets].astype(bool)
+
+
+def _is_stream(source):
+    """A file path or an iterator of chunks"""
+    return isinstance(source, (str, os.PathLike)) or iter(source) is source
+
+
+def _read_chunks(source):
+    """The chunks of elements of a set
+
+    A file is read line by line, an element per line, as strings.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        reader = pd.read_csv(source, header=None, usecols=[0], dtype=str,
+                             chunksize=CHUNK_SIZE)
+        for chunk in reader:
+            yield chunk.iloc[:, 0].to_numpy()
+    elif _is_stream(source):
+        yield from source
+    else:
+        yield source
+
+
+def _shard_path(folder, i, shard):
+    return os.path.join(folder, f"{i}_{shard}.bin")
+
+
+def _write_shards(hashes, i, folder, n_shards):
+    """Append the hashes to the shard files, one file is open at a time"""
+    # small integers are sorted in linear time
+    shard = (hashes % np.uint64(n_shards)).astype(
+        np.uint16 if n_shards <= 2 ** 16 else np.int64)
+    order = np.argsort(shard, kind="stable")
+    bounds = np.searchsorted(shard[order], np.arange(n_shards + 1))
+    hashes = hashes[order]
+    for s in range(n_shards):
+        with open(_shard_path(folder, i, s), "ab") as f:
+            hashes[bounds[s]:bounds[s + 1]].tofile(f)
+
+
+def _spill(source, i, folder, n_shards):
+    """Hash the elements of a set and write them to shard files
+
+    The hashes are buffered in memory and written in batches of
+    `CHUNK_SIZE`, so a set keeps at most one file open.
+    """
+    buffer, buffered = [], 0
+    for chunk in _read_chunks(source):
+        hashes = _hash(chunk)
+        buffer.append(hashes)
+        buffered += len(hashes)
+        if buffered >= CHUNK_SIZE:
+            _write_shards(np.concatenate(buffer), i, folder, n_shards)
+            buffer, buffered = [], 0
+    # every shard file is created, even if empty
+    _write_shards(np.concatenate(buffer) if buffer
+                  else np.empty(0, dtype=np.uint64), i, folder, n_shards)
+
+
+def _count_shard(folder, shard, n_sets):
+    """The histogram of masks of the elements in a shard"""
+    hashes = [np.fromfile(_shard_path(folder, i, shard), dtype=np.uint64)
+              for i in range(n_sets)]
+    return _histogram(_membership(hashes))
+
+
+def _count_sharded(data, n_shards, n_jobs):
+    """Count the subsets of sets that don't fit in memory
+
+    Elements are identified by their 64-bit hash and partitioned into
+    shards on disk by the hash, an element is always in the same shard.
+    Each shard is counted on its own, only one shard per worker is
+    in memory, the histograms of all shards are merged.
+    """
+    n_jobs = os.cpu_count() if n_jobs is None else n_jobs
+    with tempfile.TemporaryDirectory() as folder, \
+            ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        list(pool.map(lambda i: _spill(data[i], i, folder, n_shards),
+                      range(len(data))))
+        histograms = list(pool.map(
+            lambda shard: _count_shard(folder, shard, len(data)),
+            range(n_shards)))
+    return _merge_histograms(histograms)
+
+
+def _bars(pos, length, horizontal, width=0.6):
+    """The vertices of bars at pos, along x or y"""
+    lo, hi = pos - width / 2, pos + width / 2
+    zero = np.zeros(len(pos))
+    x = np.column_stack([lo, lo, hi, hi])
+    y = np.column_stack([zero, length, length, zero])
+    if horizontal:
+        x, y = y, x
+    return np.stack([x, y], axis=-1)
 
 
 def upset(
@@ -11,62 +167,202 @@ def upset(
         max_subset_size=None,
         min_degree=None,
         max_degree=None,
+        sort_by="size",
         show_counts=True,
         show_percentages=False,
+        color="#333333",
+        inactive_color="#dddddd",
+        n_shards=64,
+        n_jobs=None,
         figure=None,
-        **kwargs,
-) -> UpSet:
+) -> dict:
     """Upset plot for intersections between arbitrary sets
 
-    Unlike `venn`, this will not consider duplicates
+    Unlike `venn`, this will not consider duplicates.
+    Each element is encoded as a bitmask of the sets it belongs to,
+    the intersections are counted over the masks, so it scales to
+    millions of elements and tens of sets.
 
     Parameters
     ----------
     data :
-        A series of anything, set will be auto computed for it
+        A list of anything, set will be auto computed for it,
+        or a dict of name to elements. A set can also be a file path,
+        with an element per line, or an iterator of arrays,
+        these are counted out of core
     names :
         The name for each set
     orient : {'v',  'h'}
+        The direction of the intersection bars
     min_subset_size :
         Minimum/Maximum size threshold of a subset to be shown in the plot.
     max_subset_size :
     min_degree :
         Minimum/Maximum degree of a subset to be shown in the plot
     max_degree :
+    sort_by : {'size', 'degree'}
+        The order of subsets, the largest first,
+        or the lowest degree first then the largest
     show_counts :
         Whether to label the intersection size bars
         with the cardinality of the intersection.
     show_percentages :
         Whether to label the intersection size bars
         with the percentage of the intersection relative to the total dataset.
+    color :
+        The color of bars and the dots of sets in a subset
+    inactive_color :
+        The color of the dots of sets not in a subset
+    n_shards : int, default: 64
+        The number of partitions of elements when counting out of core,
+        more shards use less memory
+    n_jobs : int
+        The number of threads to count out of core,
+        default to the number of CPUs
     figure :
         A user input figure instance
-    kwargs: Pass to :class:`upsetplot.UpSet`
+
+    Returns
+    -------
+    dict of Axes
+        "intersections", "matrix" and "totals"
 
     """
-    try:
-        from upsetplot import UpSet
-        from upsetplot import from_contents
-    except ImportError:
-        raise ImportError("Try `pip install UpSetPlot`")
+    if isinstance(data, Mapping):
+        names = set_default(names, list(data.keys()))
+        data = list(data.values())
+    if names is None:
+        names = [f"Set{i}" for i in range(len(data))]
+    if len(names) != len(data):
+        raise ValueError(f"Got {len(names)} names for {len(data)} sets")
+    if orient not in ("v", "h"):
+        raise ValueError(f"orient must be 'v' or 'h', got '{orient}'")
+    n_sets = len(data)
+
+    if any(_is_stream(d) for d in data):
+        subsets, sizes = _count_sharded(data, n_shards, n_jobs)
+    else:
+        subsets, sizes = _histogram(_membership(data))
+    member = _unpack(subsets, n_sets)
+    total = sizes.sum()
+    totals = (member * sizes[:, np.newaxis]).sum(axis=0)
+    degree = member.sum(axis=1)
+
+    keep = degree > 0
+    if min_subset_size is not None:
+        keep &= sizes >= min_subset_size
+    if max_subset_size is not None:
+        keep &= sizes <= max_subset_size
+    if min_degree is not None:
+        keep &= degree >= min_degree
+    if max_degree is not None:
+        keep &= degree <= max_degree
+    member, sizes, degree = member[keep], sizes[keep], degree[keep]
+    if sort_by == "size":
+        order = np.argsort(-sizes, kind="stable")
+    elif sort_by == "degree":
+        order = np.lexsort([-sizes, degree])
+    else:
+        raise ValueError(f"sort_by must be 'size' or 'degree', "
+                         f"got '{sort_by}'")
+    member, sizes = member[order], sizes[order]
+    n_subsets = len(sizes)
 
     if figure is None:
         figure = plt.gcf()
-    params = dict(
-        orientation="vertical" if orient == "h" else "horizontal",
-        min_subset_size=min_subset_size,
-        max_subset_size=max_subset_size,
-        min_degree=min_degree,
-        max_degree=max_degree,
-        show_counts=show_counts,
-        show_percentages=show_percentages,
-        **kwargs
-    )
-    if names is None:
-        names = [f"Set{i}" for i in range(len(data))]
-    data = [np.unique(d) for d in data]
-    contents = dict(zip(names, data))
-    data = from_contents(contents)
-    p = UpSet(data, **params)
-    p.plot(fig=figure)
-    return p
+    horizontal = orient == "h"
+    if horizontal:
+        gs = figure.add_gridspec(2, 2, width_ratios=[n_sets, 6],
+                                 height_ratios=[3, max(n_subsets, 1)],
+                                 wspace=0.05, hspace=0.05, bottom=0.2)
+        ax_matrix = figure.add_subplot(gs[1, 0])
+        ax_totals = figure.add_subplot(gs[0, 0], sharex=ax_matrix)
+        ax_inter = figure.add_subplot(gs[1, 1], sharey=ax_matrix)
+    else:
+        gs = figure.add_gridspec(2, 2, width_ratios=[3, max(n_subsets, 1)],
+                                 height_ratios=[6, n_sets],
+                                 wspace=0.05, hspace=0.05, right=0.8)
+        ax_matrix = figure.add_subplot(gs[1, 1])
+        ax_totals = figure.add_subplot(gs[1, 0], sharey=ax_matrix)
+        ax_inter = figure.add_subplot(gs[0, 1], sharex=ax_matrix)
+
+    # the matrix, subsets along the intersection bars, sets across
+    sub_pos = np.arange(n_subsets)
+    set_pos = np.arange(n_sets)
+    if not horizontal:
+        # the first set on top
+        set_pos = set_pos[::-1]
+    grid_sub, grid_set = np.meshgrid(sub_pos, set_pos, indexing="ij")
+    dot_colors = np.where(member.ravel(), color, inactive_color)
+    lo = np.where(member, grid_set, np.inf).min(axis=1)
+    hi = np.where(member, grid_set, -np.inf).max(axis=1)
+    if horizontal:
+        ax_matrix.scatter(grid_set.ravel(), grid_sub.ravel(), c=dot_colors,
+                          s=60, zorder=2)
+        segments = np.stack([np.column_stack([lo, sub_pos]),
+                             np.column_stack([hi, sub_pos])], axis=1)
+    else:
+        ax_matrix.scatter(grid_sub.ravel(), grid_set.ravel(), c=dot_colors,
+                          s=60, zorder=2)
+        segments = np.stack([np.column_stack([sub_pos, lo]),
+                             np.column_stack([sub_pos, hi])], axis=1)
+    ax_matrix.add_collection(LineCollection(segments, colors=color,
+                                            linewidths=2, zorder=1))
+
+    ax_inter.add_collection(PolyCollection(
+        _bars(sub_pos, sizes, horizontal), facecolors=color))
+    ax_totals.add_collection(PolyCollection(
+        _bars(set_pos, totals, not horizontal), facecolors=color))
+
+    if show_counts or show_percentages:
+        texts = []
+        for size in sizes:
+            parts = []
+            if show_counts:
+                parts.append(f"{size}")
+            if show_percentages:
+                parts.append(f"{size / total:.1%}")
+            texts.append("\n".join(parts) if horizontal else " ".join(parts))
+        if horizontal:
+            xy = np.column_stack([sizes, sub_pos])
+            text_kw = dict(ha="left", va="center")
+        else:
+            xy = np.column_stack([sub_pos, sizes])
+            text_kw = dict(ha="center", va="bottom")
+        ax_inter.add_artist(CulledLabels(xy, texts, sizes, fontsize=8,
+                                         **text_kw))
+
+    sub_lim = (-0.5, max(n_subsets, 1) - 0.5)
+    set_lim = (-0.5, n_sets - 0.5)
+    if horizontal:
+        ax_matrix.set_xlim(*set_lim)
+        ax_matrix.set_ylim(*sub_lim[::-1])
+        ax_matrix.set_xticks(set_pos)
+        ax_matrix.set_xticklabels(names, rotation=90)
+        ax_matrix.set_yticks([])
+        ax_inter.set_xlim(0, sizes.max(initial=0) * 1.15 or 1)
+        ax_inter.tick_params(left=False, labelleft=False)
+        ax_inter.set_xlabel("Intersection size")
+        ax_totals.set_ylim(0, totals.max(initial=0) * 1.1 or 1)
+        ax_totals.tick_params(bottom=False, labelbottom=False)
+        ax_totals.yaxis.set_major_locator(MaxNLocator(3))
+        ax_totals.set_ylabel("Set size")
+    else:
+        ax_matrix.set_xlim(*sub_lim)
+        ax_matrix.set_ylim(*set_lim)
+        ax_matrix.set_xticks([])
+        ax_matrix.set_yticks(set_pos)
+        ax_matrix.set_yticklabels(names)
+        ax_matrix.tick_params(left=False, labelleft=False,
+                              right=False, labelright=True)
+        ax_inter.set_ylim(0, sizes.max(initial=0) * 1.15 or 1)
+        ax_inter.tick_params(bottom=False, labelbottom=False)
+        ax_inter.set_ylabel("Intersection size")
+        ax_totals.set_xlim(totals.max(initial=0) * 1.1 or 1, 0)
+        ax_totals.tick_params(left=False, labelleft=False)
+        ax_totals.xaxis.set_major_locator(MaxNLocator(3))
+        ax_totals.set_xlabel("Set size")
+    for ax in (ax_matrix, ax_inter, ax_totals):
+        for spine in ax.spines.values():
+            spine.set_visible(False)
+    return dict(intersections=ax_inter, matrix=ax_matrix, totals=ax_totals)
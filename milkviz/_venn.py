@@ -1,20 +1,55 @@
-from collections import Counter
-
 import matplotlib.pyplot as plt
 import numpy as np
+import pandas as pd
 from matplotlib.axes import Axes
 from typing import Set
 
+from ._sketch import SetSketch, sketch_regions
+
+
+def _element_counts(arr_list):
+    """The count of each distinct element in each list
+
+    All lists are factorized into the same integer codes,
+    returns an array of shape (number of lists, number of elements)
+    """
+    # a list of mixed types stays as objects in a Series
+    arrays = [pd.Series(arr, copy=False).to_numpy() for arr in arr_list]
+    # mixed types are compared as python objects, like Counter does
+    if len({a.dtype.kind for a in arrays}) > 1:
+        arrays = [a.astype(object) for a in arrays]
+    codes, uniques = pd.factorize(np.concatenate(arrays),
+                                  use_na_sentinel=False)
+    bounds = np.cumsum([0] + [len(a) for a in arrays])
+    return np.vstack([np.bincount(codes[start:end], minlength=len(uniques))
+                      for start, end in zip(bounds[:-1], bounds[1:])])
+
 
 def find_intersection(*arr_list):
-    count = 0
-    counter = [Counter(arr) for arr in arr_list]
-    max_ix = np.argmax([len(c) for c in counter])
-    max_size_counter = counter[max_ix]
-    counter.pop(max_ix)
-    for k1 in max_size_counter.keys():
-        count += min(max_size_counter[k1], *[c.get(k1, 0) for c in counter])
-    return count
+    """The size of intersection between lists, duplication is considered"""
+    return int(_element_counts(arr_list).min(axis=0).sum())
+
+
+def _region_sizes(arr_list):
+    """The size of each region in the venn diagram of 2 or 3 lists"""
+    counts = _element_counts(arr_list)
+    size = counts.sum(axis=1)
+
+    def inter(*ix):
+        return int(counts[list(ix)].min(axis=0).sum())
+
+    if len(arr_list) == 2:
+        s1s2 = inter(0, 1)
+        return size[0] - s1s2, size[1] - s1s2, s1s2
+    s1s2, s1s3, s2s3 = inter(0, 1), inter(0, 2), inter(1, 2)
+    s1s2s3 = inter(0, 1, 2)
+    return (size[0] - s1s2 - s1s3 + s1s2s3,
+            size[1] - s1s2 - s2s3 + s1s2s3,
+            s1s2 - s1s2s3,
+            size[2] - s1s3 - s2s3 + s1s2s3,
+            s1s3 - s1s2s3,
+            s2s3 - s1s2s3,
+            s1s2s3)
 
 
 def venn(
@@ -25,6 +60,7 @@ def venn(
         subset_labels=None,
         normalize_to=1.0,
         weighted=True,
+        show_error=False,
         ax=None,
 ) -> Axes:
     """Venn diagram for 2 & 3 Sets
@@ -38,10 +74,12 @@ def venn(
     data :
         1) A list of sets
         2) A list of list, will compute intersection, duplication
-        will be considered.
+        will be considered. Arrays and Series are used as is.
         3) A list of number denotes the regions in venn diagram
         in the following order: (10, 01, 11)
         or (100, 010, 110, 001, 101, 011, 111)
+        4) A list of :class:`SetSketch`, the regions are estimated
+        from the sketches, for sets that don't fit in memory
     names :
         The name for each set
     colors :
@@ -57,6 +95,9 @@ def venn(
         may be useful to fit the text labels better.
     weighted :
         If True, the circle area is weighted by the size of sets
+    show_error : bool, default: False
+        Show the standard error of the regions estimated from
+        :class:`SetSketch` in the subset labels
     ax :
 
     """
@@ -69,29 +110,22 @@ def venn(
         ax = plt.gca()
     s = len(data)
     colors = ("#F1C266", "#65BBC4", "#F3A292") if colors is None else colors
+    errors = None
+    # estimate intersection from sketches
+    if isinstance(data[0], SetSketch):
+        if s not in (2, 3):
+            raise ValueError(f"You have {s} sketches. Venn diagram is for "
+                             f"2 or 3 sets, please use upset plot instead.")
+        sizes, errors = sketch_regions(data)
+        data = tuple(int(v) for v in np.round(sizes))
+        venn_num = s
     # compute intersection for user
-    if not isinstance(data[0], (Set, int)):
-        if s == 2:
-            s1, s2 = data
-            s1s2 = find_intersection(s1, s2)
-            s1, s2 = len(s1), len(s2)
-            data = (s1 - s1s2, s2 - s1s2, s1s2)
-            venn_num = 2
-        else:
-            s1, s2, s3 = data
-            s1s2 = find_intersection(s1, s2)
-            s1s3 = find_intersection(s1, s3)
-            s2s3 = find_intersection(s2, s3)
-            s1s2s3 = find_intersection(s1, s2, s3)
-            s1, s2, s3 = len(s1), len(s2), len(s3)
-            data = (s1 - s1s2 - s1s3 + s1s2s3,
-                    s2 - s1s2 - s2s3 + s1s2s3,
-                    s1s2 - s1s2s3,
-                    s3 - s1s3 - s2s3 + s1s2s3,
-                    s1s3 - s1s2s3,
-                    s2s3 - s1s2s3,
-                    s1s2s3)
-            venn_num = 3
+    elif not isinstance(data[0], (Set, int)):
+        if s not in (2, 3):
+            raise ValueError(f"You have {s} lists. Venn diagram is for "
+                             f"2 or 3 lists, please use upset plot instead.")
+        data = tuple(int(v) for v in _region_sizes(data))
+        venn_num = s
     # user input is regions area
     elif isinstance(data[0], int):
         if s == 3:
@@ -135,6 +169,8 @@ def venn(
         if p is not None:
             p.set_alpha(a)
 
+    if subset_labels is None and show_error and errors is not None:
+        subset_labels = [f"{v}\n±{e:.0f}" for v, e in zip(data, errors)]
     if subset_labels is not None:
         for patch_id, label in zip(patch_order, subset_labels):
             lb = v.get_label_by_id(patch_id)
@@ -1,6 +1,11 @@
 """Custom colormap in milkviz"""
+import hashlib
+import os
+import threading
+from functools import lru_cache
 
-from matplotlib.colors import ListedColormap
+import numpy as np
+from matplotlib.colors import ListedColormap, to_hex, to_rgb
 
 ECHARTS16 = [
     "#5470c6", "#91cc75", "#fac858", "#ee6666", "#9a60b4", "#73c0de", "#3ba272", "#fc8452",
@@ -22,3 +27,112 @@ retro_metro = ListedColormap(RETRO_METRO, name="retro_metro", N=9)
 dutch_field = ListedColormap(DUTCH_FIELD, name="dutch_field", N=9)
 river_nights = ListedColormap(RIVER_NIGHTS, name="river_nights", N=9)
 spring_pastels = ListedColormap(SPRING_PASTELS, name="spring_pastels", N=9)
+
+
+# The number of levels of each RGB channel of candidate colors
+CANDIDATE_LEVELS = 24
+# The range of lightness of candidate colors, too dark or too light
+# colors are hard to tell apart on a white background
+LIGHTNESS_RANGE = (25, 85)
+CACHE_DIR = os.environ.get(
+    "MILKVIZ_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "milkviz"))
+
+
+def _rgb_to_lab(rgb):
+    """Convert sRGB in [0, 1] to CIELAB under D65"""
+    rgb = np.asarray(rgb, dtype=float)
+    linear = np.where(rgb <= 0.04045, rgb / 12.92,
+                      ((rgb + 0.055) / 1.055) ** 2.4)
+    m = np.array([[0.4124, 0.3576, 0.1805],
+                  [0.2126, 0.7152, 0.0722],
+                  [0.0193, 0.1192, 0.9505]])
+    xyz = linear @ m.T / [0.95047, 1., 1.08883]
+    delta = 6 / 29
+    f = np.where(xyz > delta ** 3, np.cbrt(xyz),
+                 xyz / (3 * delta ** 2) + 4 / 29)
+    return np.column_stack([116 * f[:, 1] - 16,
+                            500 * (f[:, 0] - f[:, 1]),
+                            200 * (f[:, 1] - f[:, 2])])
+
+
+def _candidates():
+    """A grid of sRGB colors in the lightness range, and their Lab"""
+    levels = np.linspace(0, 1, CANDIDATE_LEVELS)
+    rgb = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"),
+                   axis=-1).reshape(-1, 3)
+    lab = _rgb_to_lab(rgb)
+    keep = (lab[:, 0] >= LIGHTNESS_RANGE[0]) & \
+        (lab[:, 0] <= LIGHTNESS_RANGE[1])
+    return rgb[keep], lab[keep]
+
+
+def _farthest_colors(n, seed):
+    """Greedy farthest point sampling in CIELAB, after the seed colors"""
+    rgb, lab = _candidates()
+    seed = [to_hex(c) for c in seed][:n]
+    dist = np.full(len(lab), np.inf)
+    for c in _rgb_to_lab([to_rgb(c) for c in seed]):
+        dist = np.minimum(dist, ((lab - c) ** 2).sum(axis=1))
+    chosen = []
+    for _ in range(n - len(seed)):
+        i = np.argmax(dist)
+        chosen.append(i)
+        dist = np.minimum(dist, ((lab - lab[i]) ** 2).sum(axis=1))
+    return seed + [to_hex(c) for c in rgb[chosen]]
+
+
+@lru_cache(maxsize=32)
+def _distinct_colors(n, seed):
+    key = hashlib.sha1(
+        f"{n}{seed}{CANDIDATE_LEVELS}{LIGHTNESS_RANGE}".encode()).hexdigest()
+    path = os.path.join(CACHE_DIR, f"distinct_{key}.txt")
+    try:
+        with open(path) as f:
+            colors = f.read().split()
+        if len(colors) == n:
+            return tuple(colors)
+    except OSError:
+        pass
+    colors = _farthest_colors(n, seed)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # write then rename, a reader never sees a partial file
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp, "w") as f:
+            f.write("\n".join(colors))
+        os.replace(tmp, path)
+    except OSError:
+        # the cache is optional, like on a read-only file system
+        pass
+    return tuple(colors)
+
+
+def distinct_colors(n, seed=None):
+    """Generate n colors that are maximally distinct from each other
+
+    The colors are picked one by one from a grid of sRGB colors,
+    each is the farthest from the picked ones in CIELAB space.
+    The palettes are cached in memory and on disk, under
+    ``~/.cache/milkviz`` or the path set by ``MILKVIZ_CACHE``.
+
+    Parameters
+    ----------
+    n : int
+        The number of colors
+    seed : list of colors
+        The first colors of the palette, default to the echarts colors
+
+    Returns
+    -------
+    list of hex colors
+
+    """
+    seed = ECHARTS16 if seed is None else seed
+    return list(_distinct_colors(n, tuple(to_hex(c) for c in seed)))
+
+
+def distinct_cmap(n, seed=None, name=None):
+    """A :class:`ListedColormap` of n distinct colors,
+    see :func:`distinct_colors`"""
+    name = f"distinct{n}" if name is None else name
+    return ListedColormap(distinct_colors(n, seed), name=name, N=n)
@@ -1,12 +1,28 @@
 import math
 import matplotlib as mpl
 import numpy as np
+import pandas as pd
+import threading
 import warnings
-from matplotlib.colors import Colormap
+from functools import lru_cache
+from matplotlib.colors import Colormap, ListedColormap, to_hex, \
+    is_color_like, to_rgba_array
+from matplotlib.font_manager import FontProperties
+from matplotlib.lines import Line2D
+from matplotlib.transforms import Affine2D
 from natsort import natsorted
 from typing import Mapping
 
 from legendkit import ListLegend
+from .colormap import distinct_cmap, distinct_colors
+
+# The number of rows in each column of a categorical legend
+MAX_LEGEND_ROWS = 25
+# The color of the types grouped as other in a truncated legend
+OTHER_COLOR = "#cccccc"
+_SHAPE_MARKERS = {"circle": "o", "square": "s"}
+# The check and the registration of a colormap are done at once
+_REGISTER_LOCK = threading.Lock()
 
 
 def rotate_points(px, py, origin, angle):
@@ -23,6 +39,23 @@ def rotate_points(px, py, origin, angle):
     return qx, qy
 
 
+def get_affine(rotate=None, transform=None):
+    """The rotation in degrees around the origin, followed by a transform
+
+    The transform is an :class:`matplotlib.transforms.Affine2D`
+    or a 3x3 affine matrix. An Affine2D is used as is, not copied,
+    modifying it later updates the artists that use it.
+    """
+    if transform is not None and not isinstance(transform, Affine2D):
+        transform = Affine2D(np.asarray(transform, dtype=float))
+    if rotate is None:
+        return set_default(transform, Affine2D())
+    rotation = Affine2D().rotate_deg(rotate)
+    if transform is None:
+        return rotation
+    return rotation + transform
+
+
 def set_default(arg, default):
     if arg is None:
         return default
@@ -31,7 +64,17 @@ def set_default(arg, default):
 
 
 def get_colormap(name):
-    """Handle changes to matplotlib colormap interface in 3.6."""
+    """Handle changes to matplotlib colormap interface in 3.6.
+
+    A name like "distinct200" is generated by
+    :func:`milkviz.colormap.distinct_cmap` and registered on first use,
+    a :class:`matplotlib.colors.Colormap` is returned as is.
+    """
+    if isinstance(name, Colormap):
+        return name
+    if isinstance(name, str) and name.startswith("distinct") \
+            and name[8:].isdigit():
+        register_colormap(name, distinct_cmap(int(name[8:])))
     try:
         return mpl.colormaps[name]
     except AttributeError:
@@ -40,30 +83,44 @@ def get_colormap(name):
 
 def register_colormap(name, cmap):
     """Handle changes to matplotlib colormap interface in 3.6."""
-    try:
-        if name not in mpl.colormaps:
-            mpl.colormaps.register(cmap, name=name)
-    except AttributeError:
-        mpl.cm.register_cmap(name, cmap)
+    with _REGISTER_LOCK:
+        try:
+            if name not in mpl.colormaps:
+                mpl.colormaps.register(cmap, name=name)
+        except AttributeError:
+            mpl.cm.register_cmap(name, cmap)
+
 
+def cat_colors(types, order=None, cmap=None, colors=None, max_items=None):
+    """The colors of types, the unique types and their legend colors
 
-def cat_colors(types, order=None, cmap=None, colors=None):
+    If there are more than `max_items` types, the less frequent ones
+    are colored by `OTHER_COLOR`, to match a legend truncated by
+    :func:`set_cat_legend` with the same `max_items`.
+    """
     if order is None:
         uni_types = np.unique(types)
         uni_types = natsorted(uni_types)
     else:
         uni_types = order
     types_count = len(uni_types)
-    uni_mapper = dict(zip(uni_types, np.arange(types_count)))
 
     if colors is None:
         cmap = set_default(cmap, "echarts")
         if not isinstance(cmap, Colormap):
             cmap = get_colormap(cmap)
         if cmap.N < types_count:
-            warnings.warn(f"Usage of duplicated colors, found {types_count} "
-                          f"types but only {cmap.N} colors.")
-        color_array = [cmap(uni_mapper[t]) for t in types]
+            if isinstance(cmap, ListedColormap):
+                # extend the palette with the most distinct colors
+                cmap = ListedColormap(
+                    distinct_colors(types_count, seed=cmap.colors),
+                    N=types_count)
+            else:
+                warnings.warn(f"Usage of duplicated colors, "
+                              f"found {types_count} types "
+                              f"but only {cmap.N} colors.")
+        codes = pd.Index(uni_types).get_indexer(np.asarray(types).ravel())
+        color_array = cmap(codes)
         legend_color = [cmap(i) for i in np.arange(types_count)]
     else:
         if isinstance(colors, Mapping):
@@ -74,9 +131,57 @@ def cat_colors(types, order=None, cmap=None, colors=None):
             cmapper = dict(zip(types, colors))
             legend_color = [cmapper[t] for t in uni_types]
 
+    if max_items is not None and types_count > max_items:
+        legend_color = other_colors(legend_color,
+                                    type_counts(types, uni_types), max_items)
+        # the types not in the order are also other
+        palette = to_rgba_array(list(legend_color) + [OTHER_COLOR])
+        color_array = palette[
+            pd.Index(uni_types).get_indexer(np.asarray(types).ravel())]
+
     return color_array, uni_types, legend_color
 
 
+def type_counts(types, labels):
+    """The number of occurrences of each label in types"""
+    counts = pd.Series(np.asarray(types).ravel()).value_counts()
+    return counts.reindex(labels, fill_value=0).to_numpy()
+
+
+def top_items(counts, max_items):
+    """The index of the items shown in a legend of `max_items`
+
+    The `max_items - 1` most frequent ones in their original order,
+    the last item is for the others.
+    """
+    return np.sort(np.argsort(-np.asarray(counts),
+                              kind="stable")[:max_items - 1])
+
+
+def other_colors(colors, counts, max_items):
+    """Replace the colors of the items grouped as other by `OTHER_COLOR`"""
+    if max_items is None or len(colors) <= max_items:
+        return colors
+    grouped = [OTHER_COLOR] * len(colors)
+    for i in top_items(counts, max_items):
+        grouped[i] = colors[i]
+    return grouped
+
+
+@lru_cache(maxsize=64)
+def _cat_handles(colors, shape, edgecolor, edgewidth, markersize):
+    """The legend handles of colors, shared by all legends of the same look
+
+    A handle is only a template for the legend, it's never drawn,
+    so the same handles are reused across axes and figures.
+    """
+    marker = _SHAPE_MARKERS.get(shape, shape)
+    return tuple(Line2D([0], [0], marker=marker, ls="", color=c,
+                        markersize=markersize, mfc=c, mec=edgecolor,
+                        mew=edgewidth)
+                 for c in colors)
+
+
 def set_cat_legend(labels,
                    colors,
                    ax,
@@ -84,7 +189,29 @@ def set_cat_legend(labels,
                    shape="circle",
                    edgecolor=None,
                    edgewidth=None,
-                   legend_kw=None, ):
+                   legend_kw=None,
+                   counts=None, ):
+    """Legend of categories
+
+    All types are shown by default. If `max_items` is set in legend_kw,
+    at most `max_items` types are shown, the most frequent ones by
+    `counts` are kept, or the first ones if `counts` is None, the others
+    are grouped as one item in `OTHER_COLOR`. Color the plot with
+    :func:`cat_colors` or :func:`other_colors` of the same `max_items`
+    to match it. The items are laid out in columns of at most 25 rows.
+    """
+    legend_kw = set_default(legend_kw, {}).copy()
+    max_items = legend_kw.pop("max_items", None)
+    labels, colors = list(labels), list(colors)
+    if max_items is not None and len(labels) > max_items:
+        if counts is None:
+            keep = np.arange(max_items - 1)
+        else:
+            keep = top_items(counts, max_items)
+        n_other = len(labels) - len(keep)
+        labels = [labels[i] for i in keep] + [f"Other ({n_other} types)"]
+        colors = [colors[i] for i in keep] + [OTHER_COLOR]
+
     legend_options = dict(
         title=title,
         loc="out right center",
@@ -96,13 +223,21 @@ def set_cat_legend(labels,
         borderpad=0,
         frameon=False
     )
+    if "ncols" not in legend_kw:
+        legend_options["ncol"] = math.ceil(len(labels) / MAX_LEGEND_ROWS)
     legend_options = {**legend_options, **legend_kw}
-    legend_items = [
-        (shape, label, dict(facecolor=color,
-                            edgecolor=edgecolor,
-                            linewidth=edgewidth,
-                            )) for label, color in zip(labels, colors)
-    ]
+    fontsize = FontProperties(
+        size=set_default(legend_options.get("fontsize"),
+                         mpl.rcParams["legend.fontsize"])
+    ).get_size_in_points()
+    markersize = fontsize * min(legend_options["handleheight"],
+                                legend_options["handlelength"])
+    if edgecolor is not None:
+        edgecolor = to_hex(edgecolor, keep_alpha=True) \
+            if is_color_like(edgecolor) else None
+    handles = _cat_handles(tuple(to_hex(c, keep_alpha=True) for c in colors),
+                           shape, edgecolor, edgewidth, markersize)
     ListLegend(ax=ax,
-               legend_items=legend_items,
+               handles=list(handles),
+               labels=labels,
                **legend_options)
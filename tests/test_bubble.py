@@ -0,0 +1,24 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from milkviz._bubble import _grid_bins
+
+
+def _sorted_rows(a):
+    return a[np.lexsort(a.T[::-1])]
+
+
+@pytest.mark.parametrize("gridsize", [20, 7, (20, 11)])
+def test_hex_bins_match_hexbin(gridsize):
+    rng = np.random.default_rng(0)
+    x, y = rng.normal(size=(2, 5000))
+    centers, inverse = _grid_bins(x, y, gridsize)
+
+    _, ax = plt.subplots()
+    hb = ax.hexbin(x, y, gridsize=gridsize, mincnt=1)
+    offsets = hb.get_offsets()
+    order = np.lexsort(offsets.T[::-1])
+    assert np.allclose(_sorted_rows(centers), offsets[order])
+    counts = np.bincount(inverse)[np.lexsort(centers.T[::-1])]
+    assert np.array_equal(counts, hb.get_array()[order])
@@ -0,0 +1,31 @@
+import tracemalloc
+
+import numpy as np
+
+import milkviz as mv
+from milkviz._clustermap import POOL_ENTRIES
+
+MB = 2 ** 20
+
+
+def test_memmap_peak_memory(tmp_path):
+    shape = (20000, 500)
+    data = np.memmap(tmp_path / "data.f32", dtype=np.float32, mode="w+",
+                     shape=shape)
+    data[:] = np.random.default_rng(0).random(shape, dtype=np.float32)
+    data.flush()
+    data = np.memmap(tmp_path / "data.f32", dtype=np.float32, mode="r",
+                     shape=shape)
+
+    cells = data.size
+    # the documented bound, the NaN mask and the pooling of float32,
+    # with some room for the figure
+    bound = 3 * cells + 14 * min(cells, POOL_ENTRIES) + 32 * MB
+    tracemalloc.start()
+    try:
+        mv.anno_clustermap(data, row_cluster=False, col_cluster=False,
+                           heatmap_render="image")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < bound
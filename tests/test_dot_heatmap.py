@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+import milkviz as mv
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    return rng.random((4, 5)), rng.random((4, 5)) * 10, rng.random((4, 5))
+
+
+@pytest.mark.parametrize("param", ["dot_norm", "matrix_norm"])
+def test_hue_norm_from_stats(data, param):
+    size, dot_hue, matrix_hue = data
+    hue = dot_hue if param == "dot_norm" else matrix_hue
+    stats = mv.StreamingStats().update(hue[:2]).merge(
+        mv.StreamingStats().update(hue[2:]))
+    dm = mv.dot_heatmap(size, dot_hue=dot_hue, matrix_hue=matrix_hue,
+                        **{param: stats})
+    norm = getattr(dm, param)
+    assert norm.vmin == hue.min()
+    assert norm.vmax == hue.max()
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import milkviz as mv
+from milkviz._community import label_propagation
+from milkviz._graph import _Arrowheads, _edge_index
+
+sp = pytest.importorskip("scipy.sparse")
+
+
+def test_symmetric_adjacency_is_undirected():
+    adj = sp.csr_matrix(np.array([[0, 1, 0, 0],
+                                  [1, 0, 2, 0],
+                                  [0, 2, 0, 3],
+                                  [0, 0, 3, 0]]))
+    labels, src, dst, weight, kept = _edge_index(adj)
+    assert labels == [0, 1, 2, 3]
+    assert list(zip(src, dst)) == [(0, 1), (1, 2), (2, 3)]
+    assert list(weight) == [1, 2, 3]
+    assert list(kept) == [True, False, True, False, True, False]
+
+
+def test_asymmetric_adjacency_keeps_all_entries():
+    adj = sp.csr_matrix(np.array([[0, 1, 0],
+                                  [0, 0, 1],
+                                  [1, 1, 0]]))
+    _, src, dst, weight, _ = _edge_index(adj)
+    assert list(zip(src, dst)) == [(0, 1), (1, 2), (2, 0), (2, 1)]
+    assert len(weight) == 4
+
+
+def test_per_edge_values_follow_the_stored_entries():
+    adj = sp.csr_matrix(np.array([[0, 1, 0],
+                                  [1, 0, 2],
+                                  [0, 2, 0]]))
+    # the stored entries are (0, 1), (1, 0), (1, 2), (2, 1)
+    ax = mv.graph(adj, layout="fast_fr", edges_color=[1., 9., 2., 9.])
+    edges, = [c for c in ax.collections if c.get_zorder() == 1]
+    assert list(edges.get_array()) == [1., 2.]
+    with pytest.raises(ValueError):
+        mv.graph(adj, layout="fast_fr", edges_color=[1., 2.])
+
+
+def test_graph_draws_each_undirected_edge_once():
+    adj = sp.csr_matrix(np.array([[0, 1, 0, 0],
+                                  [1, 0, 1, 0],
+                                  [0, 1, 0, 1],
+                                  [0, 0, 1, 0]]))
+    ax = mv.graph(adj, layout="fast_fr")
+    # the nodes are drawn above the edges
+    edges = [c for c in ax.collections if c.get_zorder() == 1]
+    assert [len(c.get_paths()) for c in edges] == [3]
+
+
+def test_layout_cache(tmp_path):
+    edges = [("a", "b"), ("b", "c"), ("c", "a"), ("c", "d")]
+    _, pos = mv.graph(edges, layout="fast_fr", layout_cache=tmp_path,
+                      return_pos=True)
+    files = list(tmp_path.iterdir())
+    assert len(files) == 1 and files[0].suffix == ".npy"
+    _, cached = mv.graph(edges[::-1], layout="fast_fr",
+                         layout_cache=tmp_path, return_pos=True)
+    for node in pos:
+        assert np.allclose(pos[node], cached[node])
+
+
+def test_arrowheads_follow_the_view():
+    pos = {"a": (0, 0), "b": (1, 1)}
+    ax = mv.graph([("a", "b")], pos=pos, connectionstyle=None,
+                  arrowstyle="->")
+    arrows, = [c for c in ax.collections if isinstance(c, _Arrowheads)]
+    ax.set_xlim(-10, 10)
+    ax.figure.canvas.draw()
+    head, *base = arrows.get_paths()[0].vertices[:3]
+    direction = head - np.mean(base, axis=0)
+    edge = np.diff(ax.transData.transform([pos["a"], pos["b"]]), axis=0)[0]
+    assert np.degrees(abs(np.arctan2(*direction[::-1])
+                          - np.arctan2(*edge[::-1]))) < 1
+
+
+@pytest.mark.parametrize("edges", [[], [(0, 0), (1, 1)]])
+def test_collapse_without_edges(edges):
+    assert list(label_propagation(3, [e[0] for e in edges],
+                                  [e[1] for e in edges])) == [0, 1, 2]
+    ax = mv.graph(np.array(edges, dtype=int).reshape(-1, 2),
+                  nodes=["a", "b", "c"], layout="fast_fr", collapse=True)
+    nodes, = [c for c in ax.collections if c.get_zorder() == 2]
+    assert len(nodes.get_offsets()) == 3
@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+
+import milkviz as mv
+
+rng = np.random.default_rng(0)
+points = rng.random((300, 2))
+values = rng.random(300)
+matrix = rng.random((5, 6))
+
+PLOTS = {
+    "point_types": partial(mv.point_map, points,
+                           types=rng.choice(list("abcdef"), 300)),
+    "point_values": partial(mv.point_map, points, values=values, rotate=20),
+    "polygon": partial(mv.polygon_map,
+                       [np.array([[0, 0], [1, 0], [1, 1]]) + [i, 0]
+                        for i in range(5)], values=np.arange(5)),
+    "bubble": partial(mv.bubble, x=points[:, 0], y=points[:, 1],
+                      size=values, hue=values),
+    "graph": partial(mv.graph, [(1, 2), (2, 3), (3, 1), (3, 4)],
+                     pos={1: (0, 0), 2: (1, 0), 3: (1, 1), 4: (0, 1)},
+                     nodes_color=[1, 2, 3, 4], arrowstyle="->"),
+    "stacked_bar": partial(mv.stacked_bar, pd.DataFrame({
+        "g": rng.choice(list("xyz"), 500), "s": rng.choice(list("pq"), 500)
+    }), group="g", stacked="s"),
+    "dot_heatmap": partial(mv.dot_heatmap, matrix, dot_hue=matrix),
+    "upset": partial(mv.upset, [[1, 2, 3], [2, 3, 4], [4, 5]]),
+}
+
+
+@pytest.fixture
+def no_pyplot(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("pyplot state is used")
+
+    for name in ("gca", "gcf", "sca", "figure", "subplots"):
+        monkeypatch.setattr(plt, name, fail)
+
+
+def render(name):
+    return mv.render_rgba(PLOTS[name], figsize=(5, 4), dpi=60, copy=True)
+
+
+def test_threads_render_the_same_pixels(no_pyplot):
+    serial = {name: render(name) for name in PLOTS}
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        names = list(PLOTS) * 3
+        for name, pixels in zip(names, pool.map(render, names)):
+            assert np.array_equal(pixels, serial[name]), name
+
+
+def test_canvas_is_reused_in_a_thread():
+    first = mv.render_rgba(PLOTS["bubble"], figsize=(3, 3), dpi=50)
+    kept = first.copy()
+    copied = mv.render_rgba(PLOTS["bubble"], figsize=(3, 3), dpi=50,
+                            copy=True)
+    second = mv.render_rgba(PLOTS["graph"], figsize=(3, 3), dpi=50)
+    # the view of the first call is overwritten by the next one
+    assert np.shares_memory(first, second)
+    assert np.array_equal(first, second)
+    assert not np.array_equal(first, kept)
+    assert np.array_equal(copied, kept)
+    # another size gets another canvas
+    other = mv.render_rgba(PLOTS["bubble"], figsize=(2, 2), dpi=50)
+    assert not np.shares_memory(other, second)
+
+
+def test_each_thread_has_its_own_canvas():
+    # both renders are in flight at once, so they run in two threads
+    barrier = threading.Barrier(2)
+
+    def render_in_thread(name):
+        pixels = mv.render_rgba(PLOTS[name], figsize=(3, 3), dpi=50)
+        barrier.wait(timeout=60)
+        return pixels
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        a, b = pool.map(render_in_thread, ["bubble", "graph"])
+    assert not np.shares_memory(a, b)
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from milkviz._scale import StreamingStats, get_norm
+
+
+def test_norm_without_quantiles():
+    values = np.random.default_rng(0).normal(size=10000)
+    norm = get_norm(values)
+    assert (norm.vmin, norm.vmax) == (values.min(), values.max())
+
+    stats = StreamingStats(quantiles=False).update(values)
+    assert stats.sketch is None
+    assert list(stats.quantile([0, 1])) == [values.min(), values.max()]
+    with pytest.raises(ValueError):
+        stats.norm(clip=(1, 99))
+    with pytest.raises(ValueError):
+        StreamingStats().merge(stats)
+
+
+def test_quantiles_of_chunks():
+    values = np.random.default_rng(0).random(100000)
+    stats = StreamingStats.from_chunks(np.array_split(values, 10))
+    q = stats.quantile([.01, .5, .99])
+    assert np.allclose(q, np.quantile(values, [.01, .5, .99]), atol=0.01)
+    norm = stats.norm(clip=(1, 99))
+    assert norm.clip and np.isclose(norm.vmin, q[0])
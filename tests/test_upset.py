@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+import pytest
+
+from milkviz._upset import _count_sharded, _histogram, _membership
+
+resource = pytest.importorskip("resource")
+
+
+def _open_files():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        pytest.skip("Can't count the open files")
+
+
+@pytest.fixture
+def low_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE,
+                       (_open_files() + 32, hard))
+    yield
+    resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+
+def test_count_many_streams_with_few_files(low_file_limit):
+    rng = np.random.default_rng(0)
+    sets = [rng.choice(5000, 1000, replace=False) for _ in range(30)]
+    streams = [iter(np.array_split(s, 4)) for s in sets]
+    subsets, sizes = _count_sharded(streams, n_shards=64, n_jobs=30)
+
+    expected_subsets, expected_sizes = _histogram(_membership(sets))
+    order = np.lexsort(subsets.T[::-1])
+    expected = np.lexsort(expected_subsets.T[::-1])
+    assert np.array_equal(subsets[order], expected_subsets[expected])
+    assert np.array_equal(sizes[order], expected_sizes[expected])
@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib as mpl
+import numpy as np
+from matplotlib.colors import ListedColormap, to_hex, to_rgba
+from matplotlib.legend import Legend
+
+import milkviz as mv
+from milkviz.colormap import distinct_cmap
+from milkviz.utils import OTHER_COLOR, cat_colors, get_colormap
+
+
+def _legend_texts(ax):
+    legend, = [a for a in ax.get_children() if isinstance(a, Legend)]
+    return [t.get_text() for t in legend.get_texts()]
+
+
+def test_cat_colors_group_other():
+    types = np.array(["a"] * 5 + ["b"] * 3 + ["c"] * 2 + ["d"])
+    color_array, labels, legend_colors = cat_colors(types, max_items=3)
+    assert list(labels) == ["a", "b", "c", "d"]
+    assert [to_hex(c) for c in legend_colors[2:]] == [OTHER_COLOR] * 2
+    other = np.isin(types, ["c", "d"])
+    assert np.allclose(color_array[other], to_rgba(OTHER_COLOR))
+    assert not np.allclose(color_array[~other], to_rgba(OTHER_COLOR))
+
+
+def test_point_map_legend_is_not_truncated_by_default():
+    rng = np.random.default_rng(0)
+    types = np.arange(60).astype(str)
+    ax = mv.point_map(rng.random((60, 2)), types=types)
+    assert len(_legend_texts(ax)) == 60
+
+
+def test_point_map_truncated_legend_matches_colors():
+    rng = np.random.default_rng(0)
+    types = np.repeat(np.arange(10).astype(str), np.arange(10, 0, -1))
+    ax = mv.point_map(rng.random((len(types), 2)), types=types,
+                      legend_kw=dict(max_items=4))
+    assert _legend_texts(ax) == ["0", "1", "2", "Other (7 types)"]
+    colors = ax.collections[0].get_facecolors()
+    assert np.allclose(colors[np.isin(types, list("3456789"))],
+                       to_rgba(OTHER_COLOR))
+
+
+def test_get_colormap():
+    cmap = ListedColormap(["red", "blue"])
+    assert get_colormap(cmap) is cmap
+    assert get_colormap("viridis").name == "viridis"
+    assert get_colormap("distinct60").N == 60
+
+
+def test_graph_with_colormap_object():
+    cmap = ListedColormap(["red", "blue"])
+    ax = mv.graph([("a", "b"), ("b", "c")], nodes_color=[1, 2, 3],
+                  layout="fast_fr", node_cmap=cmap)
+    assert any(c.get_cmap() is cmap for c in ax.collections)
+
+
+def test_register_colormap_in_threads(monkeypatch):
+    registry = type(mpl.colormaps)
+    contains = registry.__contains__
+    checked = threading.local()
+
+    def slow_contains(self, name):
+        # let the other threads check the name before it's registered
+        found = contains(self, name)
+        if not getattr(checked, "done", False):
+            checked.done = True
+            time.sleep(0.05)
+        return found
+
+    # the colors are generated before, the threads only register
+    distinct_cmap(67)
+    monkeypatch.setattr(registry, "__contains__", slow_contains)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        cmaps = list(pool.map(get_colormap, ["distinct67"] * 4))
+    assert [c.N for c in cmaps] == [67] * 4